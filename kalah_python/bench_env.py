@@ -0,0 +1,49 @@
+from kalah_python.utils.agents import RandomAgent, MiniMaxAgent
+from kalah_python.utils.board import Board
+from kalah_python.utils.env import KalahEnv, HeadlessKalahEnv
+from contextlib import redirect_stdout
+import argparse
+import os
+import random
+import time
+
+
+def bench_fsm(agent_cls, games: int) -> float:
+    board = Board()
+    env = KalahEnv(board, agent_cls(board=board, verbose=False, buffer=False),
+                   agent_cls(board=board, verbose=False, buffer=False))
+    start = time.perf_counter()
+    for _ in range(games):
+        env.play_game()
+        env.reset()
+    return time.perf_counter() - start
+
+
+def bench_headless(agent_cls, games: int, check_invariants: bool) -> float:
+    env = HeadlessKalahEnv(agent_cls(verbose=False, buffer=False), agent_cls(verbose=False, buffer=False),
+                           check_invariants=check_invariants)
+    start = time.perf_counter()
+    for _ in range(games):
+        env.play_game()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--games", default=200, type=int)
+    parser.add_argument("--agent", default="random", choices=["random", "minimax"])
+    parser.add_argument("--seed", default=0, type=int)
+    args = parser.parse_args()
+    agent_cls = RandomAgent if args.agent == "random" else MiniMaxAgent
+    print("{:<22} {:>10} {:>10}".format("path", "seconds", "games/sec"))
+    for name, run in (("fsm (KalahEnv)", lambda: bench_fsm(agent_cls, args.games)),
+                      ("headless", lambda: bench_headless(agent_cls, args.games, True)),
+                      ("headless, no checks", lambda: bench_headless(agent_cls, args.games, False))):
+        random.seed(args.seed)
+        with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):  # e.g. "swapping side"
+            elapsed = run()
+        print("{:<22} {:>10.3f} {:>10.1f}".format(name, elapsed, args.games / elapsed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+from kalah_python.utils.agents import MiniMaxAgent
+from kalah_python.utils.board import PackedBoard
+from kalah_python.utils.engine import make_move, legal_moves
+from kalah_python.utils.enums import Action, SearchMode, Side
+from typing import List, Tuple
+import argparse
+import random
+import time
+
+
+def sample_positions(num_positions: int, seed: int) -> List[Tuple[PackedBoard, Side]]:
+    """
+    the start position, followed by positions reached with random play.
+    """
+    rng = random.Random(seed)
+    positions = [(PackedBoard(), Side.SOUTH)]
+    while len(positions) < num_positions:
+        cells = list(PackedBoard.INIT_CELLS)
+        side = Side.SOUTH
+        for _ in range(rng.randint(4, 30)):
+            record = make_move(cells, rng.choice(legal_moves(cells, side)), side)
+            if record.game_over:
+                break
+            side = record.next_side
+        else:
+            positions.append((PackedBoard(cells), side))
+    return positions
+
+
+def bench(search_mode: SearchMode, positions: List[Tuple[PackedBoard, Side]]) -> Tuple[int, float]:
+    agent = MiniMaxAgent(verbose=False, buffer=False, search_mode=search_mode)
+    nodes, elapsed = 0, 0.0
+    for packed, side in positions:
+        agent.board.unpack(packed)
+        agent.side = side
+        possible_actions = [Action(hole) for hole in packed.nonzero_holes(side)]
+        start = time.perf_counter()
+        agent.decide_on_action(possible_actions)
+        elapsed += time.perf_counter() - start
+        nodes += agent.nodes
+    return nodes, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--positions", default=20, type=int)
+    parser.add_argument("--seed", default=0, type=int)
+    args = parser.parse_args()
+    positions = sample_positions(args.positions, args.seed)
+    print("{:<12} {:>10} {:>10} {:>12}".format("mode", "nodes", "seconds", "nodes/sec"))
+    for search_mode in (SearchMode.LEGACY, SearchMode.MAKE_UNMAKE):
+        nodes, elapsed = bench(search_mode, positions)
+        print("{:<12} {:>10} {:>10.3f} {:>12.0f}".format(search_mode.name, nodes, elapsed, nodes / elapsed))
+
+
+if __name__ == '__main__':
+    main()
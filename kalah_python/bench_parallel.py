@@ -0,0 +1,89 @@
+from kalah_python.utils.agents import MiniMaxAgent
+from kalah_python.utils.board import PackedBoard
+from kalah_python.utils.enums import Action
+from kalah_python.utils.parallel_search import SearchPool
+from kalah_python.utils.perft import parse_position
+from kalah_python.utils.tablebase import Tablebase
+from kalah_python.bench_search import SEARCH_POSITIONS
+from kalah_python.config import TABLEBASE
+from typing import Dict, List, Optional
+import argparse
+import os
+import time
+
+
+def search_position(text: str, processes: int, depth: int, time_budget: Optional[float],
+                    tablebase: Optional[Tablebase]) -> dict:
+    """
+    searches the position with a fresh agent (and fresh workers). 1 process is the plain MiniMaxSearch.
+    """
+    cells, side, moves = parse_position(text)
+    search_pool = SearchPool(processes) if processes > 1 else None
+    agent = MiniMaxAgent(verbose=False, buffer=False, depth=depth, time_budget=time_budget, tablebase=tablebase,
+                         search_pool=search_pool)
+    if search_pool is not None:
+        search_pool.start()  # (with the agent's settings) not part of the time of the search
+    packed = PackedBoard(cells)
+    agent.board.unpack(packed)
+    agent.side = side
+    possible_actions = [Action(hole) for hole in packed.nonzero_holes(side)]
+    if moves == 1:
+        possible_actions.append(Action.SWAP)
+    try:
+        start = time.perf_counter()
+        action = agent.decide_on_action(possible_actions)
+        elapsed = time.perf_counter() - start
+    finally:
+        if search_pool is not None:
+            search_pool.close()
+    return {'depth': agent.searcher.depth_reached, 'nodes': agent.nodes, 'seconds': elapsed, 'move': str(action)}
+
+
+def default_processes() -> List[int]:
+    """
+    :return: 1, 2, 4, ... up to the cores (and the cores themselves)
+    """
+    cores = os.cpu_count()
+    counts = [1]
+    while counts[-1] * 2 <= cores:
+        counts.append(counts[-1] * 2)
+    if counts[-1] != cores:
+        counts.append(cores)
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--processes", nargs="+", default=default_processes(), type=int)
+    parser.add_argument("--positions", nargs="+", default=list(SEARCH_POSITIONS), choices=list(SEARCH_POSITIONS))
+    # the time to reach this depth is the speedup
+    parser.add_argument("--depth", default=10, type=int)
+    # and the depth reached in this many seconds (0 skips it)
+    parser.add_argument("--time_budget", default=1.0, type=float)
+    # probe the endgame tablebase (see build_tablebase.py), on every process
+    parser.add_argument("--tablebase", dest='tablebase', default=False, action='store_true')
+    parser.add_argument("--tablebase_path", default=TABLEBASE, type=str)
+    args = parser.parse_args()
+    tablebase = Tablebase(args.tablebase_path) if args.tablebase else None
+    print("{:<12} {:>9} {:>6} {:>10} {:>9} {:>8} {:>8} {:>11}".format(
+        "position", "processes", "depth", "nodes", "seconds", "speedup", "move", "depth@budget"))
+    totals: Dict[int, float] = {processes: 0.0 for processes in args.processes}
+    for name in args.positions:
+        base = None
+        for processes in args.processes:
+            result = search_position(SEARCH_POSITIONS[name], processes, args.depth, None, tablebase)
+            base = base or result['seconds']
+            totals[processes] += result['seconds']
+            reached = search_position(SEARCH_POSITIONS[name], processes, args.depth, args.time_budget,
+                                      tablebase)['depth'] if args.time_budget else "-"
+            print("{:<12} {:>9} {:>6} {:>10} {:>9.3f} {:>7.2f}x {:>8} {:>11}".format(
+                name, processes, result['depth'], result['nodes'], result['seconds'], base / result['seconds'],
+                result['move'], reached))
+    base = totals[args.processes[0]]
+    for processes, seconds in totals.items():
+        print("{:<12} {:>9} {:>6} {:>10} {:>9.3f} {:>7.2f}x".format("total", processes, "", "", seconds,
+                                                                      base / seconds))
+
+
+if __name__ == '__main__':
+    main()
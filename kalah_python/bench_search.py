@@ -0,0 +1,127 @@
+from kalah_python.utils.agents import MiniMaxAgent
+from kalah_python.utils.board import PackedBoard
+from kalah_python.utils.enums import Action
+from kalah_python.utils.perft import POSITIONS, parse_position
+from kalah_python.config import BENCH_SEARCH_BASELINE
+from typing import Dict
+import argparse
+import json
+import sys
+import time
+import tracemalloc
+
+# the positions of the suite (in the format of utils/perft.py)
+SEARCH_POSITIONS: Dict[str, str] = {
+    "opening": POSITIONS["start"][0],
+    "middlegame": POSITIONS["middlegame"][0],
+    # 5 of south's 6 moves capture
+    "captures": "4,10,0,0,3,2,11,11,3,1,0,15,13,4,11,10;S;10",
+    "endgame": POSITIONS["endgame"][0],
+}
+
+
+def search_position(text: str, depth: int, tt_size_mb: float) -> dict:
+    """
+    a fixed depth search from the position, with a fresh agent (so an empty transposition table).
+    """
+    cells, side, moves = parse_position(text)
+    agent = MiniMaxAgent(verbose=False, buffer=False, depth=depth, tt_size_mb=tt_size_mb)
+    packed = PackedBoard(cells)
+    agent.board.unpack(packed)
+    agent.side = side
+    possible_actions = [Action(hole) for hole in packed.nonzero_holes(side)]
+    if moves == 1:
+        possible_actions.append(Action.SWAP)
+    start = time.perf_counter()
+    action = agent.decide_on_action(possible_actions)
+    elapsed = time.perf_counter() - start
+    return {
+        'depth': agent.searcher.depth_reached,
+        'nodes': agent.nodes,
+        'seconds': elapsed,
+        'nps': agent.nodes / elapsed,
+        'move': str(action),
+    }
+
+
+def bench_position(text: str, depth: int, tt_size_mb: float, repeat: int) -> dict:
+    """
+    :return: the fastest of repeat searches, and the peak memory of one more (traced, so not timed).
+    """
+    result = min((search_position(text, depth, tt_size_mb) for _ in range(repeat)), key=lambda res: res['seconds'])
+    tracemalloc.start()
+    search_position(text, depth, tt_size_mb)
+    result['peak_kb'] = tracemalloc.get_traced_memory()[1] / 1024
+    tracemalloc.stop()
+    return result
+
+
+def total_nps(results: Dict[str, dict]) -> float:
+    return sum(result['nodes'] for result in results.values()) / sum(result['seconds'] for result in results.values())
+
+
+def compare(results: Dict[str, dict], baseline: Dict[str, dict], threshold: float) -> bool:
+    """
+    prints the changes against the baseline.
+    :return: False if the throughput of the suite (all its nodes over all its time) dropped by more than
+    threshold (a fraction). The short searches are too noisy to fail on their own.
+    """
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            print("{:<12} no baseline".format(name))
+            continue
+        notes = ["{}: {} -> {}".format(key, base[key], result[key])
+                 for key in ('depth', 'nodes', 'move') if result[key] != base[key]]
+        print("{:<12} nps {:+6.1f}%  peak memory {:+6.1f}%{}".format(
+            name, 100.0 * (result['nps'] / base['nps'] - 1.0), 100.0 * (result['peak_kb'] / base['peak_kb'] - 1.0),
+            "  (search changed: " + ", ".join(notes) + ")" if notes else ""))
+    change = total_nps(results) / total_nps({name: baseline[name] for name in results if name in baseline}) - 1.0
+    passed = change >= -threshold
+    print("{:<12} nps {:+6.1f}%  {}".format("total", 100.0 * change, "ok" if passed else "FAIL"))
+    return passed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--depth", default=10, type=int)
+    parser.add_argument("--tt_size_mb", default=16.0, type=float)
+    # time every position this many times, and keep the fastest
+    parser.add_argument("--repeat", default=5, type=int)
+    parser.add_argument("--baseline", default=BENCH_SEARCH_BASELINE, type=str)
+    # fail if the nodes/sec of the suite drops by more than this fraction
+    parser.add_argument("--threshold", default=0.2, type=float)
+    # record the results as the new baseline (e.g. on a new machine, or after an intended change)
+    parser.add_argument("--save", dest='save', default=False, action='store_true')
+    args = parser.parse_args()
+    print("{:<12} {:>5} {:>10} {:>9} {:>10} {:>8} {:>10}".format(
+        "position", "depth", "nodes", "seconds", "nodes/sec", "move", "peak KiB"))
+    results = dict()
+    for name, text in SEARCH_POSITIONS.items():
+        result = bench_position(text, args.depth, args.tt_size_mb, args.repeat)
+        results[name] = result
+        print("{:<12} {:>5} {:>10} {:>9.3f} {:>10.0f} {:>8} {:>10.0f}".format(
+            name, result['depth'], result['nodes'], result['seconds'], result['nps'], result['move'],
+            result['peak_kb']))
+    if args.save:
+        with open(args.baseline, 'w') as f:
+            json.dump({'depth': args.depth, 'tt_size_mb': args.tt_size_mb, 'positions': results}, f, indent=2)
+        print("saved the baseline to", args.baseline)
+        return
+    try:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    except FileNotFoundError:
+        print("no baseline at {} (run with --save to record one)".format(args.baseline))
+        return
+    if (baseline['depth'], baseline['tt_size_mb']) != (args.depth, args.tt_size_mb):
+        print("the baseline was recorded with --depth {} --tt_size_mb {}; nothing to compare"
+              .format(baseline['depth'], baseline['tt_size_mb']))
+        return
+    if not compare(results, baseline['positions'], args.threshold):
+        print("throughput dropped by more than {:.0f}%".format(100 * args.threshold))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
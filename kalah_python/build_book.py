@@ -0,0 +1,26 @@
+from kalah_python.utils.book import build_book
+from kalah_python.config import OPENING_BOOK
+import argparse
+import sys
+import time
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    # the book covers every line of this many plies. 3 searches 315 leaves, 4 searches 2073
+    parser.add_argument("--plies", default=3, type=int)
+    # the search depth at every leaf
+    parser.add_argument("--depth", default=10, type=int)
+    # defaults to one per core
+    parser.add_argument("--processes", default=None, type=int)
+    parser.add_argument("--out", default=OPENING_BOOK, type=str)
+    args = parser.parse_args()
+    start = time.perf_counter()
+    entries = build_book(args.plies, args.depth, args.out, processes=args.processes,
+                         on_leaf=lambda done, total: print("\r{}/{} leaves".format(done, total),
+                                                           end="", file=sys.stderr))
+    print("\n{} positions -> {} ({:.1f}s)".format(len(entries), args.out, time.perf_counter() - start))
+
+
+if __name__ == '__main__':
+    main()
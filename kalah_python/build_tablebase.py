@@ -0,0 +1,23 @@
+from kalah_python.utils.tablebase import build_tablebase, level_offsets
+from kalah_python.config import TABLEBASE
+import argparse
+import time
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    # solve every position with at most this many seeds in the holes.
+    # 10 takes seconds (2 MB), 12 about a minute on one core (10 MB, 1.5 GB of memory to build)
+    parser.add_argument("--max_seeds", default=10, type=int)
+    # defaults to one per core
+    parser.add_argument("--processes", default=None, type=int)
+    parser.add_argument("--out", default=TABLEBASE, type=str)
+    args = parser.parse_args()
+    start = time.perf_counter()
+    build_tablebase(args.max_seeds, args.out, processes=args.processes)
+    print("{} positions -> {} ({:.1f}s)".format(level_offsets(args.max_seeds)[-1], args.out,
+                                                time.perf_counter() - start))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+"""
+Drives random trigger sequences through utils.fsm.StateMachine and transitions.Machine, built from the same
+transitions (Agent.TRANSITIONS, and the same with before/after callbacks on every transition), and checks
+that they agree on the states, the order of the callbacks, and the errors of the invalid triggers.
+transitions is a dev dependency (requirements-dev.txt); the agents don't need it.
+"""
+from kalah_python.utils.agents import Agent
+from kalah_python.utils.enums import AgentState
+from kalah_python.utils.fsm import StateMachine
+from transitions import Machine
+from typing import List, Optional, Tuple, Union
+import argparse
+import random
+import sys
+
+
+def with_callbacks(transitions: List[Union[list, dict]]) -> List[dict]:
+    """
+    :return: the transitions as dicts, with a before and an after callback on every one.
+    """
+    result = list()
+    for transition in transitions:
+        if not isinstance(transition, dict):
+            trigger, source, dest = transition
+            transition = {'trigger': trigger, 'source': source, 'dest': dest}
+        result.append(dict(transition, before=transition.get('before', "before_" + transition['trigger']),
+                           after="after_" + transition['trigger']))
+    return result
+
+
+def recording_model(transitions: List[Union[list, dict]]) -> type:
+    """
+    :return: a model class whose on_enter_*, on_exit_* and before/after callbacks log their names.
+    """
+    names = ["on_enter_" + state.name for state in AgentState] + ["on_exit_" + state.name for state in AgentState]
+    for transition in transitions:
+        if isinstance(transition, dict):
+            names += [transition[key] for key in ('before', 'after') if transition.get(key)]
+
+    def record(name: str):
+        def callback(self):
+            self.log.append(name)
+        return callback
+
+    attrs = {name: record(name) for name in names}
+    attrs['__init__'] = lambda self: setattr(self, 'log', list())
+    return type("RecordingModel", (object,), attrs)
+
+
+def fire(model, trigger: str) -> Tuple[Optional[bool], Optional[str]]:
+    """
+    :return: what the trigger returned, and the error it raised (its class name & message), if any.
+    (the message is args[0]: str() of transitions' MachineError is its repr)
+    """
+    try:
+        return getattr(model, trigger)(), None
+    except Exception as e:
+        return None, "{}: {}".format(type(e).__name__, e.args[0] if e.args else "")
+
+
+def check(transitions: List[Union[list, dict]], sequences: int, length: int, rng: random.Random) -> int:
+    """
+    :return: the sequences on which the machines disagree.
+    """
+    machine = StateMachine(states=AgentState, transitions=transitions, initial=AgentState.INIT)
+    fsm_model_cls = recording_model(transitions)
+    machine.bind(fsm_model_cls)
+    triggers = list(machine.table)
+    mismatches = 0
+    for sequence in range(sequences):
+        fsm_model = fsm_model_cls()
+        fsm_model.state_idx = machine.initial
+        ref_model = recording_model(transitions)()
+        Machine(model=ref_model, states=AgentState, transitions=transitions, initial=AgentState.INIT)
+        fired = list()
+        for _ in range(length):
+            valid = [trigger for trigger in triggers if machine.table[trigger][fsm_model.state_idx] is not None]
+            # mostly valid triggers, so that the sequences get past INIT
+            trigger = rng.choice(valid) if rng.random() < 0.8 else rng.choice(triggers)
+            fired.append(trigger)
+            got, expected = fire(fsm_model, trigger), fire(ref_model, trigger)
+            state, ref_state = machine.states[fsm_model.state_idx], ref_model.state
+            if got != expected or state != ref_state or fsm_model.log != ref_model.log:
+                mismatches += 1
+                print("MISMATCH in sequence {} after {}".format(sequence, " ".join(fired)))
+                print("  fsm:         {} {} {}".format(state.name, got, fsm_model.log))
+                print("  transitions: {} {} {}".format(ref_state.name, expected, ref_model.log))
+                break
+    return mismatches
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sequences", default=1000, type=int)
+    parser.add_argument("--length", default=50, type=int)
+    parser.add_argument("--seed", default=0, type=int)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+    mismatches = 0
+    for name, transitions in (("agent", Agent.TRANSITIONS), ("callbacks", with_callbacks(Agent.TRANSITIONS))):
+        failed = check(transitions, args.sequences, args.length, rng)
+        mismatches += failed
+        print("{:<10} {:>6} sequences of {:>4} triggers  {}".format(
+            name, args.sequences, args.length, "ok" if not failed else "{} MISMATCHES".format(failed)))
+    if mismatches:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -16,11 +16,21 @@ def now() -> str:
 HOST = 'localhost'
 PORT = 12346
 
+# the time limit per game that the game engine enforces (ManKalah: 1 hour per agent)
+GAME_TIME_LIMIT = 3600.0
+
 
 ROOT_DIR = Path(__file__).resolve().parent
 DATA_DIR = path.join(ROOT_DIR, "data")
 LOGS_DIR = path.join(DATA_DIR, "logs")
 MODELS_DIR = path.join(DATA_DIR, "models")
+TOURNAMENTS_DIR = path.join(DATA_DIR, "tournaments")
+# the endgame tablebase that build_tablebase.py writes, and the agents read
+TABLEBASE = path.join(DATA_DIR, "tablebases", "endgame.tb")
+# the opening book that build_book.py writes, and the agents read
+OPENING_BOOK = path.join(DATA_DIR, "books", "opening.book")
+# the results bench_search.py compares against
+BENCH_SEARCH_BASELINE = path.join(ROOT_DIR, "bench_search_baseline.json")
 
 now_str = now()  # for storing every logs possible
 # paths to models
@@ -22,7 +22,7 @@
 #     # load a pretrained model, and host.
 #     ac_model = ActorCritic(state_size=Board.STATE_SIZE, action_size=len(Action))
 #     ac_model.load_state_dict(torch.load(model_path))
-#     server = Server(agent=ACAgent(ac_model, buffer=False),
+#     server = Server(agent_factory=lambda: ACAgent(ac_model, buffer=False),
 #                     listen_forever=args.listen_forever)
 #     server.start_hosting(host=args.host, port=args.port)
 #
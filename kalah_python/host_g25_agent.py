@@ -1,19 +1,87 @@
 from kalah_python.utils.server import Server
 from kalah_python.utils.agents import MiniMaxAgent
-from kalah_python.config import HOST, PORT
+from kalah_python.utils.clock import TimeManager
+from kalah_python.utils.tablebase import Tablebase
+from kalah_python.utils.book import OpeningBook
+from kalah_python.utils.parallel_search import SearchPool
+from kalah_python.config import HOST, PORT, GAME_TIME_LIMIT, TABLEBASE, OPENING_BOOK
+from functools import lru_cache, partial
+from typing import Optional
 import argparse
 
 
+# the tablebase, the book and the search pool of this (worker) process, made on first use and shared by its agents
+@lru_cache(maxsize=None)
+def load_tablebase(path: str) -> Tablebase:
+    return Tablebase(path)
+
+
+@lru_cache(maxsize=None)
+def load_book(path: str) -> OpeningBook:
+    return OpeningBook(path)
+
+
+@lru_cache(maxsize=None)
+def search_pool(processes: int) -> SearchPool:
+    return SearchPool(processes)
+
+
+def make_agent(time_budget: Optional[float], tablebase_path: Optional[str], book_path: Optional[str],
+               processes: int) -> MiniMaxAgent:
+    """
+    the agent factory of the server. (a module-level function of plain arguments, so that it pickles
+    for the worker processes)
+    """
+    return MiniMaxAgent(verbose=False, buffer=False, time_budget=time_budget,
+                        tablebase=load_tablebase(tablebase_path) if tablebase_path else None,
+                        book=load_book(book_path) if book_path else None,
+                        search_pool=search_pool(processes) if processes > 1 else None)
+
+
 def main():
     parser = argparse.ArgumentParser()
     # optional args
     parser.add_argument("--host", default=HOST, type=str)
     parser.add_argument("--port", default=PORT, type=int)
     parser.add_argument("--listen_forever", dest='listen_forever', default=False, action='store_true')
+    # play one match over stdin/stdout instead of hosting (when the engine launches the agent)
+    parser.add_argument("--stdio", dest='stdio', default=False, action='store_true')
+    # seconds to search per move (iterative deepening). searches to a fixed depth if not given.
+    parser.add_argument("--time_budget", default=None, type=float)
+    # spread the game clock over the moves instead. (overrides --time_budget)
+    parser.add_argument("--manage_time", dest='manage_time', default=False, action='store_true')
+    parser.add_argument("--game_time_limit", default=GAME_TIME_LIMIT, type=float)
+    parser.add_argument("--safety_margin", default=0.1, type=float)
+    # the fraction of the limit (past the safety margin) left when every move becomes a fast one
+    parser.add_argument("--emergency_margin", default=0.01, type=float)
+    # think on the opponent's time
+    parser.add_argument("--ponder", dest='ponder', default=False, action='store_true')
+    # cancel a search that runs longer than this many seconds
+    parser.add_argument("--decision_timeout", default=None, type=float)
+    # serve matches from this many processes, all on the same port
+    parser.add_argument("--workers", default=1, type=int)
+    # keep this many agents ready (per worker). 0 makes a fresh agent per match.
+    parser.add_argument("--pool_size", default=0, type=int)
+    # play the endgame from a tablebase (see build_tablebase.py). it is memory-mapped, and shared by all agents
+    parser.add_argument("--tablebase", dest='tablebase', default=False, action='store_true')
+    parser.add_argument("--tablebase_path", default=TABLEBASE, type=str)
+    # play the opening (and the swap decision) from a book (see build_book.py). shared by all agents
+    parser.add_argument("--book", dest='book', default=False, action='store_true')
+    parser.add_argument("--book_path", default=OPENING_BOOK, type=str)
+    # split the search of every move over this many processes. shared by all agents (one search at a time)
+    parser.add_argument("--processes", default=1, type=int)
     args = parser.parse_args()
-    server = Server(agent=MiniMaxAgent(verbose=False, buffer=False),
-                    listen_forever=args.listen_forever)
-    server.start_hosting(host=args.host, port=args.port)
+    time_manager_factory = partial(TimeManager, args.game_time_limit, safety_margin=args.safety_margin,
+                                   emergency_margin=args.emergency_margin)
+    agent_factory = partial(make_agent, args.time_budget, args.tablebase_path if args.tablebase else None,
+                            args.book_path if args.book else None, args.processes)
+    server = Server(agent_factory=agent_factory, listen_forever=args.listen_forever,
+                    time_manager_factory=time_manager_factory if args.manage_time else None,
+                    ponder=args.ponder, decision_timeout=args.decision_timeout, pool_size=args.pool_size)
+    if args.stdio:
+        server.start_stdio()
+    else:
+        server.start_hosting(host=args.host, port=args.port, workers=args.workers)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,47 @@
+from kalah_python.utils.server import Server
+from kalah_python.utils.agents import MCTSAgent
+from kalah_python.utils.clock import TimeManager
+from kalah_python.config import HOST, PORT, GAME_TIME_LIMIT
+from functools import partial
+import argparse
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    # optional args
+    parser.add_argument("--host", default=HOST, type=str)
+    parser.add_argument("--port", default=PORT, type=int)
+    parser.add_argument("--listen_forever", dest='listen_forever', default=False, action='store_true')
+    # play one match over stdin/stdout instead of hosting (when the engine launches the agent)
+    parser.add_argument("--stdio", dest='stdio', default=False, action='store_true')
+    # random games to play per move, when there is no time budget
+    parser.add_argument("--playouts", default=4096, type=int)
+    # seconds to think per move. plays --playouts if not given.
+    parser.add_argument("--time_budget", default=None, type=float)
+    # spread the game clock over the moves instead. (overrides --time_budget)
+    parser.add_argument("--manage_time", dest='manage_time', default=False, action='store_true')
+    parser.add_argument("--game_time_limit", default=GAME_TIME_LIMIT, type=float)
+    parser.add_argument("--safety_margin", default=0.1, type=float)
+    # the fraction of the limit (past the safety margin) left when every move becomes a fast one
+    parser.add_argument("--emergency_margin", default=0.01, type=float)
+    # cancel a decision that runs longer than this many seconds
+    parser.add_argument("--decision_timeout", default=None, type=float)
+    # serve matches from this many processes, all on the same port
+    parser.add_argument("--workers", default=1, type=int)
+    args = parser.parse_args()
+    # partials, so that they pickle for the worker processes
+    time_manager_factory = partial(TimeManager, args.game_time_limit, safety_margin=args.safety_margin,
+                                   emergency_margin=args.emergency_margin)
+    agent_factory = partial(MCTSAgent, verbose=False, buffer=False, playouts=args.playouts,
+                            time_budget=args.time_budget)
+    server = Server(agent_factory=agent_factory, listen_forever=args.listen_forever,
+                    time_manager_factory=time_manager_factory if args.manage_time else None,
+                    decision_timeout=args.decision_timeout)
+    if args.stdio:
+        server.start_stdio()
+    else:
+        server.start_hosting(host=args.host, port=args.port, workers=args.workers)
+
+
+if __name__ == '__main__':
+    main()
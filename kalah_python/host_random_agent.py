@@ -10,9 +10,14 @@ def main():
     parser.add_argument("--host", default=HOST, type=str)
     parser.add_argument("--port", default=PORT, type=int)
     parser.add_argument("--listen_forever", dest='listen_forever', default=False, action='store_true')
+    # play one match over stdin/stdout instead of hosting (when the engine launches the agent)
+    parser.add_argument("--stdio", dest='stdio', default=False, action='store_true')
     args = parser.parse_args()
-    server = Server(agent=RandomAgent(), listen_forever=args.listen_forever)
-    server.start_hosting(host=args.host, port=args.port)
+    server = Server(agent_factory=RandomAgent, listen_forever=args.listen_forever)
+    if args.stdio:
+        server.start_stdio()
+    else:
+        server.start_hosting(host=args.host, port=args.port)
 
 
 if __name__ == '__main__':
@@ -11,7 +11,7 @@ def main():
     parser.add_argument("--port", default=PORT, type=int)
     parser.add_argument("--listen_forever", dest='listen_forever', default=False, action='store_true')
     args = parser.parse_args()
-    server = Server(agent=UserAgent(), listen_forever=args.listen_forever)
+    server = Server(agent_factory=UserAgent, listen_forever=args.listen_forever)
     server.start_hosting(host=args.host, port=args.port)
 
 
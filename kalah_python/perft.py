@@ -0,0 +1,56 @@
+from kalah_python.utils.perft import POSITIONS, parse_position, format_position, parallel_perft, perft_env, \
+    perft_batch, divide
+import argparse
+import sys
+import time
+
+ENGINES = {
+    # make_move & unmake_move on one list of cells (the search)
+    "make_move": lambda position, depth, processes: parallel_perft(position, depth, processes),
+    # KalahEnv.execute_move on Boards (the environment)
+    "execute_move": lambda position, depth, processes: perft_env(position, depth),
+    # BatchKalahEnv, a level at a time
+    "batch": lambda position, depth, processes: perft_batch(position, depth),
+}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--depth", default=6, type=int)
+    parser.add_argument("--positions", nargs="+", default=list(POSITIONS), choices=list(POSITIONS))
+    # a position of your own instead, e.g. 0,7,7,7,7,7,7,7,0,7,7,7,7,7,7,7;S;0
+    parser.add_argument("--position", default=None, type=str)
+    parser.add_argument("--engine", default="make_move", choices=list(ENGINES))
+    # split the tree over this many processes (make_move only)
+    parser.add_argument("--processes", default=1, type=int)
+    # print the count below every move of the root
+    parser.add_argument("--divide", dest='divide', default=False, action='store_true')
+    args = parser.parse_args()
+    if args.position:
+        positions = [("custom", parse_position(args.position), [])]
+    else:
+        positions = [(name, parse_position(POSITIONS[name][0]), POSITIONS[name][1]) for name in args.positions]
+    print("{:<12} {:>5} {:>12} {:>9} {:>12}  {}".format("position", "depth", "nodes", "seconds", "nodes/sec", "ref"))
+    mismatches = 0
+    for name, position, references in positions:
+        if args.divide:
+            print(format_position(position))
+            for move, count in divide(position, args.depth).items():
+                print("  {:<8} {}".format(move, count))
+        start = time.perf_counter()
+        nodes = ENGINES[args.engine](position, args.depth, args.processes)
+        elapsed = time.perf_counter() - start
+        if args.depth <= len(references):
+            ok = nodes == references[args.depth - 1]
+            mismatches += not ok
+            ref = "ok" if ok else "MISMATCH (expected {})".format(references[args.depth - 1])
+        else:
+            ref = "-"
+        print("{:<12} {:>5} {:>12} {:>9.3f} {:>12.0f}  {}".format(name, args.depth, nodes, elapsed,
+                                                                  nodes / elapsed if elapsed else 0.0, ref))
+    if mismatches:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,41 @@
+from kalah_python.utils.sprt import SPRT, run_sprt
+from kalah_python.utils.tournament import AGENTS
+import argparse
+import sys
+import time
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("candidate", type=str, choices=list(AGENTS))  # positional
+    parser.add_argument("baseline", type=str, choices=list(AGENTS))
+    # H0: the candidate is at most elo0 stronger. H1: it is at least elo1 stronger
+    parser.add_argument("--elo0", default=0.0, type=float)
+    parser.add_argument("--elo1", default=20.0, type=float)
+    parser.add_argument("--alpha", default=0.05, type=float)
+    parser.add_argument("--beta", default=0.05, type=float)
+    parser.add_argument("--max_games", default=10000, type=int)
+    # defaults to one per core
+    parser.add_argument("--processes", default=None, type=int)
+    parser.add_argument("--opening_plies", default=1, type=int)
+    parser.add_argument("--seed", default=0, type=int)
+    parser.add_argument("--out", default=None, type=str)
+    args = parser.parse_args()
+    sprt = SPRT(args.elo0, args.elo1, args.alpha, args.beta)
+    start = time.perf_counter()
+    status = run_sprt(args.candidate, args.baseline, sprt, max_games=args.max_games,
+                      processes=args.processes, opening_plies=args.opening_plies, seed=args.seed,
+                      out_path=args.out, on_result=lambda result: print("\r" + str(sprt), end="", file=sys.stderr))
+    print()
+    print("{} vs {}: {}".format(args.candidate, args.baseline, sprt))
+    if status == SPRT.H1:
+        print("H1 accepted: {} is stronger (elo >= {})".format(args.candidate, args.elo1))
+    elif status == SPRT.H0:
+        print("H0 accepted: {} is not stronger (elo <= {})".format(args.candidate, args.elo0))
+    else:
+        print("no decision after {} games".format(sprt.games))
+    print("{:.1f}s".format(time.perf_counter() - start))
+
+
+if __name__ == '__main__':
+    main()
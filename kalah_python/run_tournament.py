@@ -0,0 +1,50 @@
+from kalah_python.utils.tournament import AGENTS, schedule, run_tournament, load_results, standings, elo_ratings
+from kalah_python.config import TOURNAMENTS_DIR, now
+from os import path
+import argparse
+import itertools
+import sys
+import time
+
+
+def print_ratings(results):
+    ratings = elo_ratings(results)
+    table = standings(results)
+    print("{:<16} {:>6} {:>8} {:>8} {:>18}".format("agent", "games", "score", "elo", "95% interval"))
+    for name, (elo, lower, upper) in sorted(ratings.items(), key=lambda item: -item[1][0]):
+        games, points = table[name]
+        print("{:<16} {:>6} {:>7.1f}% {:>8.0f} {:>8.0f} to {:<6.0f}"
+              .format(name, games, 100.0 * points / games, elo, lower, upper))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--agents", nargs="+", default=list(AGENTS), choices=list(AGENTS))
+    parser.add_argument("--games_per_pair", default=20, type=int)
+    # random moves to start every game with. 1 keeps the swap decision for the agents.
+    parser.add_argument("--opening_plies", default=1, type=int)
+    # defaults to one per core
+    parser.add_argument("--processes", default=None, type=int)
+    parser.add_argument("--seed", default=0, type=int)
+    parser.add_argument("--out", default=path.join(TOURNAMENTS_DIR, "tournament_{}.jsonl".format(now())), type=str)
+    # just rate the results of an earlier run
+    parser.add_argument("--ratings_only", default=None, type=str)
+    args = parser.parse_args()
+    if args.ratings_only:
+        print_ratings(load_results(args.ratings_only))
+        return
+    games = schedule(args.agents, args.games_per_pair, args.opening_plies, args.seed)
+    print("{} games -> {}".format(len(games), args.out))
+    start = time.perf_counter()
+
+    played = itertools.count(1)
+    results = run_tournament(games, args.out, processes=args.processes,
+                             on_result=lambda result: print("\r{}/{} games".format(next(played), len(games)),
+                                                            end="", file=sys.stderr))
+    elapsed = time.perf_counter() - start
+    print("\n{} games in {:.1f}s ({:.1f} games/sec)".format(len(results), elapsed, len(results) / elapsed))
+    print_ratings(results)
+
+
+if __name__ == '__main__':
+    main()
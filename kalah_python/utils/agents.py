@@ -1,14 +1,23 @@
 import copy
-from functools import lru_cache
-from typing import Optional, Callable, List
+from typing import Optional, Callable, List, Dict
 import numpy as np
 
-from kalah_python.utils.board import Board, Side
-from transitions import Machine
+from kalah_python.utils.batch_env import BatchKalahEnv, SWAP
+from kalah_python.utils.board import Board, PackedBoard, Side
+from kalah_python.utils.book import OpeningBook, moves_made
+from kalah_python.utils.engine import make_move, legal_moves, pie_next_side
 from overrides import overrides
+import math
 import random
-
-from kalah_python.utils.enums import AgentState, Action
+import threading
+import time
+
+from kalah_python.utils.clock import TimeManager
+from kalah_python.utils.enums import AgentState, Action, SearchMode
+from kalah_python.utils.fsm import StateMachine
+from kalah_python.utils.parallel_search import ParallelSearch, SearchPool
+from kalah_python.utils.search import MiniMaxSearch, evaluate_cells
+from kalah_python.utils.tablebase import Tablebase
 import logging
 
 # only used for RL.
@@ -18,9 +27,6 @@ import logging
 # from kalah_python.utils.dataclasses import ActionInfo
 from typing import Tuple
 
-logger = logging.getLogger("transitions.core")
-logger.setLevel(logging.WARN)
-
 
 class Agent:
     # trigger, source, dest
@@ -62,22 +68,31 @@ class Agent:
     game_over: Callable
     reset: Callable  # this trigger is to be used by KalahEnv.
 
-    # state attribute will be accessible
-    state: AgentState
-
     def __init__(self, board: Board = None, verbose: bool = True, buffer: bool = True):
         # an agent maintains an up-to-date board,
         # the current state of the agent,
         # and the current turn.
         self.board: Board = Board() if not board else board
-        self.machine = Machine(model=self, states=AgentState,
-                               transitions=Agent.TRANSITIONS, initial=AgentState.INIT)
+        # the triggers come from AGENT_MACHINE, compiled once for all agents (see below)
+        self.state_idx: int = AGENT_MACHINE.initial
         self.side: Optional[Side] = None
         self.action: Optional[Action] = None
         self.verbose: bool = verbose
         self.buffer: bool = buffer
         self.action_buffer: List[Action] = list()
         self.reward_buffer: List[float] = list()
+        # keeps track of the game clock, if set. (e.g. by the Server)
+        self.time_manager: Optional[TimeManager] = None
+        # if set, entering a decision state only flags the decision as pending, and
+        # the caller (e.g. the Server) runs it, so it can run off the caller's thread.
+        self.defer_decisions: bool = False
+        self.decision_pending: bool = False
+        # set it to ask a running decision to wrap up early (with the best action found so far)
+        self.cancel_event: threading.Event = threading.Event()
+
+    @property
+    def state(self) -> AgentState:
+        return AGENT_MACHINE.states[self.state_idx]
 
     def decide_on_action(self, possible_actions: List[Action], **kwargs) -> Action:
         """
@@ -132,26 +147,59 @@ class Agent:
         else:
             raise ValueError("Invalid side:" + str(self.side))
 
+    def decide(self):
+        """
+        get an action and register, unless decisions are deferred to the caller.
+        """
+        if self.defer_decisions:
+            self.decision_pending = True
+        else:
+            self.register_action(self.timed_decision())
+
+    def timed_decision(self) -> Action:
+        """
+        decides on an action. the time it takes is charged to the game clock.
+        """
+        start = time.perf_counter()
+        action = self.decide_on_action(self.possible_actions())
+        if self.time_manager:
+            self.time_manager.record(time.perf_counter() - start)
+        return action
+
+    def cancel_decision(self):
+        """
+        asks a decision running on another thread to return as soon as it can.
+        """
+        self.cancel_event.set()
+
+    def start_pondering(self):
+        """
+        called when the opponent starts thinking. agents that can think on the opponent's time
+        override this (and stop_pondering).
+        """
+        pass
+
+    def stop_pondering(self):
+        pass
+
+    def on_enter_INIT(self):
+        if self.time_manager:
+            self.time_manager.new_game()
+
     def on_enter_DECIDE_ON_1ST_MOVE(self):
         # 1st player
         self.side = Side.SOUTH
-        # get an action and register
-        action = self.decide_on_action(self.possible_actions())
-        self.register_action(action)
+        self.decide()
 
     def on_enter_WAIT_FOR_1ST_MOVE(self):
         # 2nd player
         self.side = Side.NORTH
 
     def on_enter_MAKE_MOVE_OR_SWAP(self):
-        # get an action and register
-        action = self.decide_on_action(self.possible_actions())
-        self.register_action(action)
+        self.decide()
 
     def on_enter_DECIDE_ON_MOVE(self):
-        # get an action and register
-        action = self.decide_on_action(self.possible_actions())
-        self.register_action(action)
+        self.decide()
 
     def on_enter_FINISHED(self):
         if self.verbose:
@@ -167,6 +215,11 @@ class Agent:
         return "side={}".format(self.side)
 
 
+# the triggers of all the agents, from Agent.TRANSITIONS
+AGENT_MACHINE = StateMachine(states=AgentState, transitions=Agent.TRANSITIONS, initial=AgentState.INIT)
+AGENT_MACHINE.bind(Agent)
+
+
 # subclasses of the Agent class.
 class RandomAgent(Agent):
 
@@ -343,13 +396,9 @@ class GameNode:
 
 def simulate_move(self, action: Action, node: GameNode) -> GameNode:
     """
+    applies the action to node.board (a PackedBoard) with the shared move engine.
         :return: GameNode.
         """
-    board = node.board
-    side = node.player
-
-    seeds_added_to_store = 0
-    # TODO: use Paul's code to implement this method. The code has been commented out for now
     if action == Action.SWAP:
         # return current side state, offset
         # SOUTH_TURN: moves
@@ -359,142 +408,60 @@ def simulate_move(self, action: Action, node: GameNode) -> GameNode:
         node.player = self.player = (Side.SOUTH, Side.NORTH)[self.player == Side.NORTH]
         return node
 
-    hole = action.value
-    seeds_to_sow = board.hole(hole, side)
-    board.set_hole(hole, side, 0)
-
-    holes = Board.HOLES_PER_SIDE  # you can directly access to the static var
-    receiving_pits = 2 * holes + 1
-    rounds = seeds_to_sow // receiving_pits  # floor() : truncate the floating points
-    extra = seeds_to_sow % receiving_pits
-    # sow the seeds of the full rounds (if any):
-    if rounds != 0:
-        for hole in range(1, holes + 1):
-            board.add_seeds_to_hole(hole, side, rounds)
-            board.add_seeds_to_hole(hole, side.opposite(), rounds)
-        board.add_seeds_to_store(side, rounds)
-    # sow the extra seeds
-    sow_side = side
-    sow_hole = hole
-    last_seed_in_store = False
-    for extra in reversed(range(1, extra + 1)):
-        sow_hole = sow_hole + 1
-        if sow_hole == 1:  # last pit was a store sow_side = sow_side.opposite()
-            sow_side = sow_side.opposite()
-        if sow_hole > holes:
-            if sow_side == side:
-                sow_hole = 0
-                board.add_seeds_to_store(sow_side, 1)
-                seeds_added_to_store += 1
-                # if the last seed goes it the store than we get another move
-                if extra == 1:
-                    last_seed_in_store = True
-                continue
-            else:
-                sow_side = sow_side.opposite()
-                sow_hole = 1
-        board.add_seeds_to_hole(sow_hole, sow_side, 1)
-
-    # capture:
-    capture_flag = False
-    if sow_side == side \
-            and sow_hole > 0 \
-            and board.hole(sow_hole, sow_side) == 1 \
-            and board.opposite_hole(sow_hole, sow_side) > 0:
-        board.add_seeds_to_store(side, 1 + board.opposite_hole(sow_hole, sow_side))
-        seeds_added_to_store += 1 + board.opposite_hole(sow_hole, sow_side)
-        board.set_hole(sow_hole, side, 0)
-        board.set_hole(sow_hole, side.opposite(), 0)
-        capture_flag = True
-
-    # game over (game ends)?
-    finished_side = None
-    if not board.nonzero_holes(side):
-        finished_side = side
-    elif not board.nonzero_holes(side.opposite()):
-        finished_side = side.opposite()
-
-    # capture_value = 0
-    if finished_side:
-        seeds = 0
-        collecting_side = finished_side.opposite()
-        for hole in range(1, holes + 1):
-            seeds = seeds + board.hole(hole, collecting_side)
-            board.set_hole(hole, collecting_side, 0)
-        board.add_seeds_to_store(collecting_side, seeds)
-        seeds_added_to_store += seeds
-        # here, we are not returning game over, but returning
-        # game_ends
-
-        node.value = evaluate_game_state(board, seeds_added_to_store, capture_flag,
-                                         last_seed_in_store, node.player, action)
-
-        node.is_over = True
-        actions = [
-            Action(value=nonzero_hole_idx)
-            for nonzero_hole_idx in board.nonzero_holes(node.player)
-        ]
-        node.moves = actions
-        return node
-
-    node.board = board
-    node.value = evaluate_game_state(board, seeds_added_to_store, capture_flag,
-                                     last_seed_in_store, node.player, action)
-
-    actions = [
+    cells = list(node.board.cells)
+    record = make_move(cells, action.value, node.player)
+    board = node.board = PackedBoard(cells)
+    node.value = evaluate_game_state(board, record.seeds_added_to_store, record.captured,
+                                     record.extra_turn, node.player, action)
+    node.is_over = record.game_over
+    node.moves = [
         Action(value=nonzero_hole_idx)
         for nonzero_hole_idx in board.nonzero_holes(node.player)
     ]
-    node.moves = actions
-    if not capture_flag and not last_seed_in_store:
-        if side == Side.SOUTH:
-            node.player = side.NORTH
-            return node
-        else:
-            node.player = side.SOUTH
-            return node
-    else:
-        return node
+    node.player = record.next_side
+    return node
 
 
 def evaluate_game_state(board, seeds_added_to_store, capturing_move, last_seed_in_store, side, action):
-    capture_value = reward_capturing_move(capturing_move, last_seed_in_store)
-    score_difference = board.store_offset(side)
-    hoard_value = board.get_hoard_side_value(side)
-    play_right_holes = reward_playing_pits_closest_to_opponent(action)
-    opponent_store = get_opponent_store(board, side)
-
-    return 0.25 * score_difference + 0.8 * capture_value + seeds_added_to_store + 0.3 * hoard_value \
-           + play_right_holes - 0.05 * opponent_store
-
-
-def reward_playing_pits_closest_to_opponent(action):
-    if action.value > 4:
-        return 2
-    else:
-        return 0
-
+    cells = board.cells if isinstance(board, PackedBoard) else board.pack().cells
+    return evaluate_cells(cells, seeds_added_to_store, capturing_move, last_seed_in_store, side, action.value)
 
-def get_opponent_store(board, side):
-    if side == Side.NORTH:
-        return board.store(Side.SOUTH)
-    else:
-        return board.store(Side.NORTH)
 
+class MiniMaxAgent(Agent):
 
-def reward_capturing_move(capturing_move, last_seed_in_store):
-    if capturing_move or last_seed_in_store:
-        if capturing_move:
-            return 20
+    def __init__(self, board: Board = None, verbose: bool = True, buffer: bool = True,
+                 search_mode: SearchMode = SearchMode.MAKE_UNMAKE, depth: int = 4, tt_size_mb: float = 16.0,
+                 time_budget: Optional[float] = None, quiescence_nodes: int = 64,
+                 tablebase: Optional[Tablebase] = None, book: Optional[OpeningBook] = None,
+                 search_pool: Optional[SearchPool] = None):
+        """
+        :param search_mode: LEGACY walks copies of GameNodes, MAKE_UNMAKE walks a single board in place.
+        :param depth: the search horizon in plies, for MAKE_UNMAKE. (LEGACY always uses max_depth=3)
+        :param tt_size_mb: the memory cap of the transposition table, for MAKE_UNMAKE.
+        :param time_budget: seconds per move, for MAKE_UNMAKE. If given, the search deepens iteratively
+        until the budget runs out, instead of stopping at depth.
+        :param quiescence_nodes: the node limit of the quiescence search at every horizon leaf,
+        for MAKE_UNMAKE. 0 turns it off.
+        :param tablebase: an endgame tablebase, for MAKE_UNMAKE. Agents can share one.
+        :param book: an opening book. Its positions are played (and swapped) from the book, without searching.
+        :param search_pool: worker processes to split the root over, for MAKE_UNMAKE. Agents can share one.
+        """
+        super().__init__(board, verbose, buffer)
+        self.search_mode = search_mode
+        if search_pool is not None:
+            self.searcher = ParallelSearch(search_pool, depth=depth, tt_size_mb=tt_size_mb,
+                                           quiescence_nodes=quiescence_nodes, tablebase=tablebase)
         else:
-            return 18
-    else:
-        return 0
-
+            self.searcher = MiniMaxSearch(depth=depth, tt_size_mb=tt_size_mb, quiescence_nodes=quiescence_nodes,
+                                          tablebase=tablebase)
+        self.time_budget: Optional[float] = time_budget
+        self.book: Optional[OpeningBook] = book
+        self.nodes: int = 0  # nodes searched for the last decision
+        # pondering: our best replies to the opponent's moves, searched on the opponent's time
+        self.pondered: Dict[PackedBoard, Tuple[Action, float, int]] = dict()
+        self.ponder_thread: Optional[threading.Thread] = None
+        self.ponder_stop: Optional[threading.Event] = None
 
-class MiniMaxAgent(Agent):
-
-    @lru_cache()
     def choose_mini_max_move(self, gnode, max_depth=3, alpha=-9999.0, beta=9999):
         """
         Choose bestMove for gnode along w final value
@@ -513,6 +480,7 @@ class MiniMaxAgent(Agent):
                 if self.verbose:
                     print(f"Calling with the Move:{move}")
                 nxt_gnode.move(move)
+                self.nodes += 1
                 self.choose_mini_max_move(nxt_gnode, max_depth, alpha, beta)  # recursion here
                 keep = (gnode.next is None)  # 1st of sequence
                 if gnode.maximizing(self.side):
@@ -550,7 +518,40 @@ class MiniMaxAgent(Agent):
             print("-------DEV------------")
             print("Your side is:")
             print(self.side)
-        root = GameNode(self.board, self.side, possible_actions)
+        if self.book is not None:
+            book_move = self.book.probe(self.board.pack().cells, self.side, possible_actions)
+            if book_move is not None:
+                if self.verbose:
+                    print("book move: {}".format(book_move))
+                self.nodes = 0
+                self.pondered.clear()
+                return book_move
+        if self.search_mode == SearchMode.MAKE_UNMAKE:
+            board = self.board.pack()
+            # the game clock decides the budget, if there is one
+            time_budget = self.time_manager.budget(self.board) if self.time_manager else self.time_budget
+            pondered = self.pondered.get(board)
+            self.pondered.clear()
+            if pondered and time_budget is None and pondered[2] >= self.searcher.depth:
+                # already searched deep enough on the opponent's time
+                if self.verbose:
+                    print("pondered move: {} (value={}, depth={})".format(*pondered))
+                self.nodes = 0
+                return pondered[0]
+            if pondered and pondered[0] in possible_actions:
+                # search the pondered move first. the transposition table is warm as well
+                possible_actions = [pondered[0]] + [action for action in possible_actions
+                                                    if action != pondered[0]]
+            best_move, value = self.searcher.search(board, self.side, possible_actions,
+                                                    time_budget=time_budget, stop_event=self.cancel_event)
+            self.nodes = self.searcher.nodes
+            if self.verbose:
+                print("best move: {} (value={}, nodes={}, depth={})"
+                      .format(best_move, value, self.nodes, self.searcher.depth_reached))
+                print("-------END------------")
+            return best_move
+        self.nodes = 0
+        root = GameNode(self.board.pack(), self.side, possible_actions)
         root.best_move = Action.SWAP
         returned_state = self.choose_mini_max_move(root)
         if self.verbose:
@@ -559,3 +560,208 @@ class MiniMaxAgent(Agent):
             print("-------END------------")
 
         return returned_state.best_move
+
+    @overrides
+    def start_pondering(self):
+        if self.search_mode != SearchMode.MAKE_UNMAKE or self.ponder_thread is not None:
+            return
+        self.pondered.clear()
+        self.ponder_stop = threading.Event()
+        self.ponder_thread = threading.Thread(target=self.searcher.ponder,
+                                              args=(self.board.pack(), self.side, self.pondered, self.ponder_stop),
+                                              daemon=True)
+        self.ponder_thread.start()
+
+    @overrides
+    def stop_pondering(self):
+        if self.ponder_thread is None:
+            return
+        self.ponder_stop.set()
+        self.ponder_thread.join()
+        self.ponder_thread = None
+        self.ponder_stop = None
+
+
+class MCTSNode:
+    """
+    a position of the tree of MCTSAgent: the cells, the side to move, and the moves made (0, 1 or 2, for the pie rule).
+    wins are those of the player who made the move to the node, out of visits. That player sits at seat,
+    on the board of the node (after a swap, the swapping player sits south).
+    """
+    __slots__ = ('cells', 'side', 'moves', 'seat', 'game_over', 'parent', 'action', 'children', 'untried',
+                 'visits', 'wins')
+
+    def __init__(self, cells: Tuple[int, ...], side: Side, moves: int, seat: Side, game_over: bool = False,
+                 parent: Optional['MCTSNode'] = None, action: Optional[Action] = None):
+        self.cells = cells
+        self.side = side
+        self.moves = moves
+        self.seat = seat
+        self.game_over = game_over
+        self.parent = parent
+        self.action = action
+        self.children: List['MCTSNode'] = list()
+        self.untried: List[Action] = list()
+        if not game_over:
+            self.untried = [Action(hole) for hole in legal_moves(list(cells), side)]
+            if moves == 1:
+                self.untried.append(Action.SWAP)
+            random.shuffle(self.untried)
+        self.visits: int = 0
+        self.wins: float = 0.0
+
+    def expand(self, action: Action) -> 'MCTSNode':
+        if action == Action.SWAP:
+            # the board stays. the swapping player takes south, and north moves next
+            child = MCTSNode(self.cells, Side.NORTH, 2, Side.SOUTH, parent=self, action=action)
+        else:
+            cells = list(self.cells)
+            record = make_move(cells, action.value, self.side)
+            child = MCTSNode(tuple(cells), pie_next_side(record, self.moves), min(self.moves + 1, 2), self.side,
+                             game_over=record.game_over, parent=self, action=action)
+        self.untried.remove(action)
+        self.children.append(child)
+        return child
+
+    def key(self) -> Tuple[Tuple[int, ...], Side, int]:
+        return self.cells, self.side, self.moves
+
+
+class MCTSAgent(Agent):
+    """
+    Monte Carlo tree search with UCT. Every batch selects batch_size leaves (a selection counts its visits
+    at once, a virtual loss that spreads the batch over the tree), and plays playouts_per_leaf random games
+    from each of them, all stepped together on a BatchKalahEnv. The tree is kept between moves.
+    """
+
+    def __init__(self, board: Board = None, verbose: bool = True, buffer: bool = True,
+                 playouts: int = 4096, time_budget: Optional[float] = None, batch_size: int = 32,
+                 playouts_per_leaf: int = 8, exploration: float = 1.4, reuse_depth: int = 4,
+                 seed: Optional[int] = None):
+        """
+        :param playouts: the playouts per move, when there is no time budget.
+        :param time_budget: seconds per move. If given, batches are played until the budget runs out.
+        :param batch_size: the leaves selected per batch.
+        :param playouts_per_leaf: the random games played from every leaf.
+        :param exploration: the exploration constant of UCT.
+        :param reuse_depth: the plies below the last root to look for the new one, to keep the tree.
+        :param seed: of the playouts. If not given, every decision seeds them from the random module (as the tree
+        is shuffled with it), so that random.seed makes the games reproducible.
+        """
+        super().__init__(board, verbose, buffer)
+        self.playouts = playouts
+        self.time_budget: Optional[float] = time_budget
+        self.batch_size = batch_size
+        self.playouts_per_leaf = playouts_per_leaf
+        self.exploration = exploration
+        self.reuse_depth = reuse_depth
+        self.root: Optional[MCTSNode] = None
+        self.env = BatchKalahEnv(batch_size * playouts_per_leaf)
+        self.seed: Optional[int] = seed
+        self.rng = np.random.default_rng(seed)
+        self.nodes: int = 0  # playouts for the last decision
+
+    @overrides
+    def decide_on_action(self, possible_actions: List[Action], **kwargs) -> Action:
+        if len(possible_actions) == 1:
+            self.nodes = 0
+            return possible_actions[0]
+        start = time.perf_counter()
+        cells = self.board.pack().cells
+        self.root = self._find_root((cells, self.side, moves_made(cells, possible_actions)))
+        time_budget = self.time_manager.budget(self.board) if self.time_manager else self.time_budget
+        if self.seed is None:
+            self.rng = np.random.default_rng(random.getrandbits(64))
+        self.nodes = 0
+        # at least one batch, even if cancelled already: it expands the root
+        while True:
+            self._run_batch()
+            self.nodes += self.env.num_games
+            if self.cancel_event.is_set():
+                break
+            if time_budget is not None:
+                if time.perf_counter() - start >= time_budget:
+                    break
+            elif self.nodes >= self.playouts:
+                break
+        best = max(self.root.children, key=lambda child: child.visits)
+        if self.verbose:
+            print("------decide_on_action----")
+            print(self.board)
+            print("your side:", self.side)
+            print("best move: {} (win rate={:.3f}, visits={}, playouts={})"
+                  .format(best.action, best.wins / best.visits, best.visits, self.nodes))
+        return best.action
+
+    def _find_root(self, key: Tuple[Tuple[int, ...], Side, int]) -> MCTSNode:
+        """
+        :return: the node of the position, from the tree of the last move if it is there (detached from its
+        parent), or a new one.
+        """
+        if self.root is not None:
+            level = [self.root]
+            for _ in range(self.reuse_depth + 1):
+                for node in level:
+                    if node.key() == key:
+                        node.parent = None
+                        node.action = None
+                        return node
+                level = [child for node in level for child in node.children]
+        cells, side, moves = key
+        return MCTSNode(tuple(cells), side, moves, side.opposite())
+
+    def _ucb(self, child: MCTSNode, log_visits: float) -> float:
+        return child.wins / child.visits + self.exploration * math.sqrt(log_visits / child.visits)
+
+    def _select(self) -> MCTSNode:
+        """
+        walks down the tree by UCT, and expands a node on the way if it has untried actions.
+        :return: the node to play out from.
+        """
+        weight = self.playouts_per_leaf
+        node = self.root
+        node.visits += weight
+        while not node.untried and node.children:
+            log_visits = math.log(node.visits)
+            node = max(node.children, key=lambda child: self._ucb(child, log_visits))
+            node.visits += weight
+        if node.untried:
+            node = node.expand(node.untried[-1])
+            node.visits += weight
+        return node
+
+    def _run_batch(self):
+        """
+        selects a batch of leaves, plays out random games from all of them at once, and backs up the results.
+        """
+        leaves = [self._select() for _ in range(self.batch_size)]
+        repeats = self.playouts_per_leaf
+        env = self.env
+        env.reset(np.repeat(np.array([leaf.cells for leaf in leaves]), repeats, axis=0))
+        env.side[:] = np.repeat([BatchKalahEnv.from_side(leaf.side) for leaf in leaves], repeats)
+        env.moves[:] = np.repeat([leaf.moves for leaf in leaves], repeats)
+        env.done[:] = np.repeat([leaf.game_over for leaf in leaves], repeats)
+        while not env.done.all():
+            # a random legal action per game
+            mask = env.legal_mask()
+            picks = np.where(mask, self.rng.random(mask.shape), -1.0).argmax(axis=1)
+            env.step(np.where(picks == 0, SWAP, picks))
+        # the result for the player who sat south on the board of the leaf (a swap in the playout moves them)
+        lead = env.cells[:, PackedBoard.SOUTH_OFFSET] - env.cells[:, PackedBoard.NORTH_OFFSET]
+        lead = np.where(env.swapped, -lead, lead)
+        south_wins = ((np.sign(lead) + 1) / 2).reshape(len(leaves), repeats).sum(axis=1)
+        for leaf, wins in zip(leaves, south_wins.tolist()):
+            self._backup(leaf, wins)
+
+    def _backup(self, leaf: MCTSNode, south_wins: float):
+        playouts = self.playouts_per_leaf
+        node = leaf
+        while node is not None:
+            node.wins += south_wins if node.seat == Side.SOUTH else playouts - south_wins
+            if node.action == Action.SWAP:
+                # the south player of the node sat north before the swap
+                south_wins = playouts - south_wins
+            node = node.parent
+
+    def __str__(self) -> str:
+        return "mcts_agent|" + super().__str__()
@@ -0,0 +1,194 @@
+"""
+N games of Kalah, stepped together with numpy.
+The boards are the rows of one (N, 16) array, in the PackedBoard layout, and a step
+makes one move in every game that is still on. The rules are those of KalahEnv.execute_move
+(and so of kalah/MKAgent/Kalah.java), including the pie rule.
+"""
+from typing import Optional, Tuple
+import numpy as np
+
+from kalah_python.utils.board import Board, PackedBoard
+from kalah_python.utils.enums import Action, Side
+
+HOLES = Board.HOLES_PER_SIDE
+RECEIVING_PITS = 2 * HOLES + 1  # all holes + the mover's store
+# the side vector holds these. (side * SOUTH_OFFSET is the offset of the side's cells)
+NORTH = 0
+SOUTH = 1
+SWAP = Action.SWAP.value
+
+
+def _sowing_orders() -> np.ndarray:
+    """
+    SOWING_ORDERS[side, hole] are the cells that the seeds of the hole are sown into, in order:
+    the next hole first, the mover's store but not the opponent's, and the hole itself last.
+    (row 0 of every side is unused)
+    """
+    orders = np.zeros((2, HOLES + 1, RECEIVING_PITS), dtype=np.intp)
+    for side in (NORTH, SOUTH):
+        offset = side * PackedBoard.SOUTH_OFFSET
+        opp_offset = PackedBoard.SOUTH_OFFSET - offset
+        # the 15 pits, counter-clockwise from the mover's 1st hole
+        cycle = [offset + hole for hole in range(1, HOLES + 1)] + [offset] \
+            + [opp_offset + hole for hole in range(1, HOLES + 1)]
+        for hole in range(1, HOLES + 1):
+            orders[side, hole] = np.roll(cycle, -hole)
+    return orders
+
+
+SOWING_ORDERS: np.ndarray = _sowing_orders()
+# the cell across the board from every hole cell (stores map to themselves; never used)
+OPPOSITE_CELLS: np.ndarray = np.array(
+    [0] + [PackedBoard.SOUTH_OFFSET + HOLES + 1 - hole for hole in range(1, HOLES + 1)]
+    + [PackedBoard.SOUTH_OFFSET] + [HOLES + 1 - hole for hole in range(1, HOLES + 1)],
+    dtype=np.intp
+)
+RECEIVING_RANGE: np.ndarray = np.arange(RECEIVING_PITS)
+
+
+class BatchKalahEnv:
+    """
+    the state of every game:
+     - cells: (N, 16) seeds, in the PackedBoard layout
+     - side: (N,) the side to move (NORTH or SOUTH)
+     - done: (N,) the game is over
+     - moves: (N,) moves made so far (a swap counts as a move)
+     - swapped: (N,) the 2nd player took the pie, i.e. the player who moved 1st now plays north
+    """
+
+    def __init__(self, num_games: int):
+        self.num_games = num_games
+        self.cells: np.ndarray = np.empty((num_games, PackedBoard.CELLS), dtype=np.int32)
+        self.side: np.ndarray = np.empty(num_games, dtype=np.int8)
+        self.done: np.ndarray = np.empty(num_games, dtype=bool)
+        self.moves: np.ndarray = np.empty(num_games, dtype=np.int32)
+        self.swapped: np.ndarray = np.empty(num_games, dtype=bool)
+        self.rows: np.ndarray = np.arange(num_games)
+        self.reset()
+
+    def reset(self, cells: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        starts all the games again, with south to move.
+        :param cells: the boards to start from. The initial board if not given.
+        :return: the cells.
+        """
+        self.cells[:] = PackedBoard.INIT_CELLS if cells is None else cells
+        self.side[:] = SOUTH
+        self.done[:] = False
+        self.moves[:] = 0
+        self.swapped[:] = False
+        return self.cells
+
+    def can_swap(self) -> np.ndarray:
+        """
+        :return: (N,) the player to move may swap. (only on the 2nd move of the game)
+        """
+        return (self.moves == 1) & ~self.done
+
+    def legal_mask(self) -> np.ndarray:
+        """
+        :return: (N, 8) the legal actions of every game: column 0 is SWAP, and columns 1 to 7 are the holes.
+        Finished games have none.
+        """
+        holes = self.holes(self.side)
+        mask = np.empty((self.num_games, HOLES + 1), dtype=bool)
+        mask[:, 0] = self.can_swap()
+        mask[:, 1:] = (holes > 0) & ~self.done[:, None]
+        return mask
+
+    def holes(self, side: np.ndarray) -> np.ndarray:
+        """
+        :param side: (N,) a side per game
+        :return: (N, 7) the holes of that side in every game
+        """
+        cols = side[:, None].astype(np.intp) * PackedBoard.SOUTH_OFFSET + np.arange(1, HOLES + 1)
+        return self.cells[self.rows[:, None], cols]
+
+    def step(self, actions: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        makes one move in every game that is not over. Finished games are left as they are,
+        whatever their action.
+        :param actions: (N,) a hole (1 to 7) or SWAP (-1) per game
+        :return: the cells, the seeds each move added to the mover's store, and done.
+        For a swap, the second is south's store lead, as in KalahEnv.execute_swap.
+        """
+        actions = np.asarray(actions)
+        on = ~self.done
+        swaps = on & (actions == SWAP)
+        moving = on & ~swaps
+        if np.any(swaps & ~self.can_swap()):
+            raise ValueError("swap is only allowed on the 2nd move of the game")
+        seeds_added = np.zeros(self.num_games, dtype=np.int32)
+
+        # swap: the board stays. the swapping player takes south, and north is to move (again)
+        seeds_added[swaps] = self.cells[swaps, PackedBoard.SOUTH_OFFSET] - self.cells[swaps, PackedBoard.NORTH_OFFSET]
+        self.swapped ^= swaps
+
+        rows = self.rows[moving]
+        if rows.size:
+            seeds_added[rows] = self._move(rows, actions[rows].astype(np.intp))
+        self.moves += on
+        return self.cells, seeds_added, self.done
+
+    def _move(self, rows: np.ndarray, holes: np.ndarray) -> np.ndarray:
+        cells = self.cells
+        side = self.side[rows].astype(np.intp)
+        if np.any((holes < 1) | (holes > HOLES)):
+            raise ValueError("invalid hole in: " + str(holes))
+        offset = side * PackedBoard.SOUTH_OFFSET
+        store_before = cells[rows, offset]
+
+        # pick the seeds
+        hole_cells = offset + holes
+        seeds = cells[rows, hole_cells]
+        if np.any(seeds == 0):
+            raise ValueError("can't move from an empty hole")
+        cells[rows, hole_cells] = 0
+        # sow: every pit of the order gets the full rounds, and the first `extra` pits one more.
+        # the 15 pits of a row are distinct, so the fancy-indexed += is safe.
+        orders = SOWING_ORDERS[side, holes]
+        rounds, extra = np.divmod(seeds, RECEIVING_PITS)
+        cells[rows[:, None], orders] += rounds[:, None] + (RECEIVING_RANGE < extra[:, None])
+        last = orders[np.arange(rows.size), (seeds - 1) % RECEIVING_PITS]
+
+        # capture: the last seed landed in an empty hole of the mover, and the opposite hole is non-empty
+        own_hole = (last > offset) & (last <= offset + HOLES)
+        opposite = OPPOSITE_CELLS[last]
+        capture = own_hole & (cells[rows, last] == 1) & (cells[rows, opposite] > 0)
+        capture_rows = rows[capture]
+        if capture_rows.size:
+            cells[capture_rows, offset[capture]] += 1 + cells[capture_rows, opposite[capture]]
+            cells[capture_rows, last[capture]] = 0
+            cells[capture_rows, opposite[capture]] = 0
+
+        # game over? both sides collect their remaining seeds. (one of them has none)
+        north_left = cells[rows, 1:HOLES + 1].sum(axis=1)
+        south_left = cells[rows, PackedBoard.SOUTH_OFFSET + 1:].sum(axis=1)
+        over = (north_left == 0) | (south_left == 0)
+        over_rows = rows[over]
+        if over_rows.size:
+            cells[over_rows, PackedBoard.NORTH_OFFSET] += north_left[over]
+            cells[over_rows, PackedBoard.SOUTH_OFFSET] += south_left[over]
+            cells[over_rows, 1:HOLES + 1] = 0
+            cells[over_rows, PackedBoard.SOUTH_OFFSET + 1:] = 0
+            self.done[over_rows] = True
+
+        # the last seed in the store earns another move. (never on the 1st move of the game: pie rule)
+        extra_turn = (last == offset) & (self.moves[rows] > 0)
+        self.side[rows] = np.where(extra_turn, side, 1 - side)
+        return cells[rows, offset] - store_before
+
+    def player_sides(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        :return: (N,) the side of the player who moved 1st, and of the player who moved 2nd.
+        """
+        first = np.where(self.swapped, NORTH, SOUTH).astype(np.int8)
+        return first, 1 - first
+
+    @staticmethod
+    def to_side(side: int) -> Side:
+        return Side.SOUTH if side == SOUTH else Side.NORTH
+
+    @staticmethod
+    def from_side(side: Side) -> int:
+        return SOUTH if side == Side.SOUTH else NORTH
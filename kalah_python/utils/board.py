@@ -1,5 +1,5 @@
 
-from typing import List
+from typing import List, Iterable, Tuple
 
 from termcolor import colored
 import numpy as np
@@ -184,6 +184,23 @@ class Board:
         else:
             raise ValueError("Invalid side:" + str(side))
 
+    def pack(self) -> 'PackedBoard':
+        """
+        returns a compact, immutable snapshot of this board.
+        :return:
+        """
+        return PackedBoard(self.north_board.tolist() + self.south_board.tolist())
+
+    def unpack(self, packed: 'PackedBoard'):
+        """
+        loads the seeds of the packed board into this board, in place.
+        (the arrays are not replaced, so references to them stay valid)
+        :param packed:
+        :return:
+        """
+        self.north_board[:] = packed.cells[:PackedBoard.SOUTH_OFFSET]
+        self.south_board[:] = packed.cells[PackedBoard.SOUTH_OFFSET:]
+
     def get_hoard_side_value(self, side: Side):
         value = 0
         if side == Side.NORTH:
@@ -215,3 +232,129 @@ class Board:
         )
 
         return north + "\n" + south
+
+
+class PackedBoard:
+    """
+    A compact, immutable and hashable board state.
+    The 16 cells use the same layout as Board's two arrays, laid side by side:
+    (north_store, north_1..north_7, south_store, south_1..south_7).
+    Reads are plain tuple indexing, so this is the representation to use
+    wherever boards are simulated or searched.
+    """
+    __slots__ = ('cells', '_hash')
+    NORTH_OFFSET: int = 0
+    SOUTH_OFFSET: int = Board.HOLES_PER_SIDE + 1
+    CELLS: int = 2 * (Board.HOLES_PER_SIDE + 1)
+    INIT_CELLS: Tuple[int, ...] = tuple(Board.BOARD_SIDE_INIT.tolist() * 2)
+
+    def __init__(self, cells: Iterable[int] = None):
+        """
+        :param cells: 16 seed counts in the packed layout. defaults to the initial (7, 7) board.
+        """
+        if cells is None:
+            cells = PackedBoard.INIT_CELLS
+        self.cells: Tuple[int, ...] = tuple(cells)
+        if len(self.cells) != PackedBoard.CELLS:
+            raise ValueError("expected {} cells but got {}".format(PackedBoard.CELLS, len(self.cells)))
+        self._hash = hash(self.cells)
+
+    @staticmethod
+    def from_board(board: Board) -> 'PackedBoard':
+        return board.pack()
+
+    def to_board(self) -> Board:
+        board = Board()
+        board.unpack(self)
+        return board
+
+    @staticmethod
+    def offset(side: Side) -> int:
+        """
+        index of the store of the given side. hole i of the side is at offset + i.
+        """
+        if side == Side.NORTH:
+            return PackedBoard.NORTH_OFFSET
+        elif side == Side.SOUTH:
+            return PackedBoard.SOUTH_OFFSET
+        else:
+            raise ValueError("Invalid side:" + str(side))
+
+    def hole(self, hole_idx: int, side: Side) -> int:
+        return self.cells[PackedBoard.offset(side) + hole_idx]
+
+    def opposite_hole(self, hole_idx: int, side: Side) -> int:
+        return self.hole(Board.opposite_hole_idx(hole_idx), side.opposite())
+
+    def holes(self, side: Side) -> Tuple[int, ...]:
+        offset = PackedBoard.offset(side)
+        return self.cells[offset + 1:offset + Board.HOLES_PER_SIDE + 1]
+
+    def nonzero_holes(self, side: Side) -> List[int]:
+        offset = PackedBoard.offset(side)
+        return [
+            hole_idx
+            for hole_idx in range(1, Board.HOLES_PER_SIDE + 1)
+            if self.cells[offset + hole_idx]
+        ]
+
+    def store(self, side: Side) -> int:
+        return self.cells[PackedBoard.offset(side)]
+
+    def store_offset(self, side: Side) -> int:
+        return self.store(side) - self.store(side.opposite())
+
+    def get_hoard_side_value(self, side: Side) -> int:
+        return sum(self.holes(side))
+
+    @property
+    def north_store(self) -> int:
+        return self.cells[PackedBoard.NORTH_OFFSET]
+
+    @property
+    def south_store(self) -> int:
+        return self.cells[PackedBoard.SOUTH_OFFSET]
+
+    @property
+    def north_holes(self) -> Tuple[int, ...]:
+        return self.holes(Side.NORTH)
+
+    @property
+    def south_holes(self) -> Tuple[int, ...]:
+        return self.holes(Side.SOUTH)
+
+    @property
+    def seeds(self) -> int:
+        return sum(self.cells)
+
+    def to_bytes(self) -> bytes:
+        """
+        16 bytes, one per cell. (a cell never holds more than 98 seeds)
+        """
+        return bytes(self.cells)
+
+    @staticmethod
+    def from_bytes(data: bytes) -> 'PackedBoard':
+        return PackedBoard(data)
+
+    # immutable, so copies can share the instance
+    def __copy__(self) -> 'PackedBoard':
+        return self
+
+    def __deepcopy__(self, memo) -> 'PackedBoard':
+        return self
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, PackedBoard):
+            return NotImplemented
+        return self.cells == other.cells
+
+    def __hash__(self) -> int:
+        return self._hash
+
+    def __repr__(self) -> str:
+        return "PackedBoard({})".format(self.cells)
+
+    def __str__(self) -> str:
+        return str(self.to_board())
+
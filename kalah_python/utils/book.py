@@ -0,0 +1,190 @@
+"""
+Opening books: the best action in every position of the first plies of the game, searched offline.
+A position is an engine Position (cells, side to move, moves made so far), so the book keeps the pie rule
+that the search leaves out: the 1st move never earns an extra turn, and north may swap after it.
+
+The book tree is every line of the first plies. Its leaves are searched deep, over a pool of processes,
+and their values are backed up the tree by negamax, which gives every inner position its best action.
+
+The file is a header (magic, the number of entries), then one entry per inner position: its 16 cells
+(a byte each), the side to move and the moves made (a byte), the action (a signed byte, -1 is a swap)
+and its value for the side to move (float32).
+"""
+from multiprocessing import Pool
+from typing import Dict, List, Optional, Tuple
+import os
+import struct
+
+from kalah_python.utils.board import PackedBoard
+from kalah_python.utils.engine import Position, children, make_move, side_offset
+from kalah_python.utils.enums import Action, Side
+from kalah_python.utils.search import MiniMaxSearch, exact_value
+
+MAGIC = b"KOB1"
+HEADER = struct.Struct("<4sI")
+ENTRY = struct.Struct("<16sBbf")
+START: Position = (PackedBoard.INIT_CELLS, Side.SOUTH, 0)
+# the searcher of this (worker) process, kept between leaves
+_searcher: Optional[MiniMaxSearch] = None
+
+
+def moves_made(cells: Tuple[int, ...], possible_actions: List[Action]) -> int:
+    """
+    :return: the moves made so far, as far as the pie rule cares: 0, 1, or 2 (for 2 or more).
+    The stores only fill up, and every 1st move reaches the store, so only the start has the initial cells.
+    """
+    if tuple(cells) == PackedBoard.INIT_CELLS:
+        return 0
+    return 1 if Action.SWAP in possible_actions else 2
+
+
+def _game_over_value(position: Position, hole: int) -> float:
+    """
+    :return: the value of a move that ends the game, for the side that makes it.
+    """
+    cells, side, _ = position
+    cells = list(cells)
+    make_move(cells, hole, side)
+    offset = side_offset(side)
+    return exact_value(cells[offset] - cells[PackedBoard.SOUTH_OFFSET - offset])
+
+
+def _search_leaf(task: Tuple[Position, int, float]) -> Tuple[Position, float]:
+    """
+    :param task: the leaf, the depth to search it to, and the memory cap of the transposition table.
+    :return: the leaf, and its value for the side to move.
+    """
+    global _searcher
+    position, depth, tt_size_mb = task
+    if _searcher is None:
+        _searcher = MiniMaxSearch(depth=depth, tt_size_mb=tt_size_mb)
+    cells, side, moves = position
+    board = PackedBoard(cells)
+    possible_actions = [Action(hole) for hole in board.nonzero_holes(side)]
+    if moves == 1:
+        possible_actions.append(Action.SWAP)
+    _, value = _searcher.search(board, side, possible_actions, depth=depth)
+    return position, value
+
+
+def book_tree(plies: int) -> Tuple[List[Position], List[Position]]:
+    """
+    :return: the inner positions of the first plies, and the leaves (the positions after them).
+    """
+    inner, leaves = dict(), dict()
+    level = [START]
+    for _ in range(plies):
+        children_level = list()
+        for position in level:
+            if position in inner:
+                continue  # a transposition
+            inner[position] = None
+            children_level.extend(child for _, child in children(position) if child is not None)
+        level = children_level
+    for position in level:
+        if position not in inner:
+            leaves[position] = None
+    return list(inner), list(leaves)
+
+
+def _negamax(position: Position, values: Dict[Position, float],
+             entries: Dict[Position, Tuple[Action, float]]) -> float:
+    """
+    backs the values of the leaves up to the position, and fills in the entries on the way.
+    :return: the value of the position, for the side to move.
+    """
+    if position in entries:
+        return entries[position][1]
+    if position in values:
+        return values[position]
+    best_action, best_value = None, 0.0
+    for action, child in children(position):
+        if child is None:
+            value = _game_over_value(position, action.value)
+        elif action != Action.SWAP and child[1] == position[1]:
+            # an extra turn
+            value = _negamax(child, values, entries)
+        else:
+            # the opponent moves next (after a swap, it moves from our old side)
+            value = -_negamax(child, values, entries)
+        # keep the first of equally good actions
+        if best_action is None or value > best_value:
+            best_action, best_value = action, value
+    entries[position] = (best_action, best_value)
+    return best_value
+
+
+def build_book(plies: int, depth: int, path: str, processes: Optional[int] = None, tt_size_mb: float = 16.0,
+               on_leaf=None) -> Dict[Position, Tuple[Action, float]]:
+    """
+    searches every leaf of the first plies to depth, over a pool of processes, and writes the book to path.
+    :param on_leaf: called after every leaf that is searched, with the number of leaves done and the total.
+    :return: the entries of the book.
+    """
+    if plies < 1:
+        raise ValueError("plies must be at least 1")
+    _, leaves = book_tree(plies)
+    tasks = [(leaf, depth, tt_size_mb) for leaf in leaves]
+    processes = processes or os.cpu_count()
+    values = dict()
+    if processes > 1:
+        with Pool(processes) as pool:
+            for position, value in pool.imap_unordered(_search_leaf, tasks):
+                values[position] = value
+                if on_leaf:
+                    on_leaf(len(values), len(tasks))
+    else:
+        for task in tasks:
+            position, value = _search_leaf(task)
+            values[position] = value
+            if on_leaf:
+                on_leaf(len(values), len(tasks))
+    entries = dict()
+    _negamax(START, values, entries)
+    write_book(entries, path)
+    return entries
+
+
+def write_book(entries: Dict[Position, Tuple[Action, float]], path: str):
+    out_dir = os.path.dirname(path)
+    if out_dir:
+        os.makedirs(out_dir, exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, len(entries)))
+        # in a fixed order, so the same book makes the same file
+        for (cells, side, moves), (action, value) in sorted(entries.items(),
+                                                             key=lambda item: (item[0][2], item[0][0],
+                                                                               item[0][1].value)):
+            flags = (side == Side.SOUTH) | moves << 1
+            f.write(ENTRY.pack(bytes(cells), flags, action.value, value))
+
+
+class OpeningBook:
+    """
+    an opening book file, read into a dict. Books are small, so loading one is cheap.
+    """
+
+    def __init__(self, path: str):
+        with open(path, 'rb') as f:
+            data = f.read()
+        magic, count = HEADER.unpack_from(data, 0)
+        if magic != MAGIC:
+            raise ValueError("not an opening book: " + path)
+        if len(data) != HEADER.size + count * ENTRY.size:
+            raise ValueError("truncated opening book: " + path)
+        self.entries: Dict[Position, Tuple[Action, float]] = dict()
+        for cells, flags, action, value in ENTRY.iter_unpack(data[HEADER.size:]):
+            side = Side.SOUTH if flags & 1 else Side.NORTH
+            self.entries[(tuple(cells), side, flags >> 1)] = (Action(action), value)
+
+    def probe(self, cells: Tuple[int, ...], side: Side, possible_actions: List[Action]) -> Optional[Action]:
+        """
+        :return: the book action of the position (with side to move), if the book has it.
+        """
+        entry = self.entries.get((tuple(cells), side, moves_made(cells, possible_actions)))
+        if entry is None or entry[0] not in possible_actions:
+            return None
+        return entry[0]
+
+    def __len__(self) -> int:
+        return len(self.entries)
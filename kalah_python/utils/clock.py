@@ -0,0 +1,89 @@
+from typing import Optional, Union, List
+import logging
+
+from kalah_python.config import GAME_TIME_LIMIT
+from kalah_python.utils.board import Board, PackedBoard
+
+
+class TimeManager:
+    """
+    Keeps track of the per-game time limit (REQ4) for an agent, and hands out a time budget
+    for every move: what is left of the clock, spread over the moves the agent is expected to make.
+    Running out of time loses the match (ERR1), so a fraction of the clock is never planned for,
+    and once the clock is nearly out every move is an emergency (fast) move.
+    """
+    # from self-play: an agent makes about 1 move for every 3 seeds left in the holes.
+    # slightly pessimistic, so that the clock lasts for the longer games.
+    MOVES_PER_SEED: float = 0.4
+    MIN_MOVES_LEFT: int = 2
+
+    def __init__(self, game_time_limit: float = GAME_TIME_LIMIT, safety_margin: float = 0.1,
+                 emergency_margin: float = 0.01, emergency_budget: float = 0.05,
+                 max_budget: Optional[float] = None):
+        """
+        :param game_time_limit: seconds the agent has for the whole game.
+        :param safety_margin: the fraction of the limit that is never planned for.
+        (it covers parsing, the protocol and the network)
+        :param emergency_margin: the fraction of the limit (on top of the safety margin) below which
+        every move is an emergency move. (so that it scales with the limit: 36s of an hour, 0.6s of a minute)
+        :param emergency_budget: the budget of an emergency move.
+        :param max_budget: an optional cap on the budget of a single move.
+        """
+        if not 0 <= safety_margin < 1:
+            raise ValueError("safety_margin should be in [0, 1):" + str(safety_margin))
+        if not 0 <= emergency_margin < 1 - safety_margin:
+            raise ValueError("emergency_margin should be in [0, 1 - safety_margin):" + str(emergency_margin))
+        self.game_time_limit = game_time_limit
+        self.safety_margin = safety_margin
+        self.emergency_margin = emergency_margin
+        self.emergency_budget = emergency_budget
+        self.max_budget = max_budget
+        self.move_times: List[float] = list()
+
+    def new_game(self):
+        self.move_times.clear()
+
+    def record(self, elapsed: float):
+        """
+        records the wall time of a decision.
+        """
+        self.move_times.append(elapsed)
+
+    @property
+    def used(self) -> float:
+        return sum(self.move_times)
+
+    @property
+    def remaining(self) -> float:
+        return self.game_time_limit - self.used
+
+    @property
+    def emergency(self) -> bool:
+        return self.remaining - self.game_time_limit * self.safety_margin \
+            < self.game_time_limit * self.emergency_margin
+
+    @staticmethod
+    def moves_left(board: Union[Board, PackedBoard]) -> int:
+        """
+        estimates how many more moves the agent will make, from the seeds left in the holes.
+        """
+        seeds_in_holes = board.seeds - board.north_store - board.south_store
+        return max(TimeManager.MIN_MOVES_LEFT, int(seeds_in_holes * TimeManager.MOVES_PER_SEED))
+
+    def budget(self, board: Union[Board, PackedBoard]) -> float:
+        """
+        :param board: the board the agent is about to move on
+        :return: seconds to spend on this move.
+        """
+        logger = logging.getLogger("budget")
+        if self.emergency:
+            logger.info("emergency move, {:.2f}s left".format(self.remaining))
+            return self.emergency_budget
+        usable = self.remaining - self.game_time_limit * self.safety_margin
+        budget = usable / TimeManager.moves_left(board)
+        if self.max_budget is not None:
+            budget = min(budget, self.max_budget)
+        return max(budget, self.emergency_budget)
+
+    def __str__(self) -> str:
+        return "moves={} used={:.2f}s remaining={:.2f}s".format(len(self.move_times), self.used, self.remaining)
@@ -0,0 +1,172 @@
+"""
+The one move engine shared by KalahEnv and the minimax search.
+It works in place on a mutable list of 16 cells, in the PackedBoard layout,
+and follows the reference rules in kalah/MKAgent/Kalah.java.
+"""
+from typing import List, Optional, Tuple
+
+from kalah_python.utils.board import Board, PackedBoard
+from kalah_python.utils.enums import Action, Side
+
+HOLES = Board.HOLES_PER_SIDE
+RECEIVING_PITS = 2 * HOLES + 1  # all holes + the mover's store
+NORTH_OFFSET = PackedBoard.NORTH_OFFSET
+SOUTH_OFFSET = PackedBoard.SOUTH_OFFSET
+# (cells, side to move, moves made so far). Only whether 0, 1 or more moves were made matters (pie rule)
+Position = Tuple[Tuple[int, ...], Side, int]
+
+
+class MoveRecord:
+    """
+    what make_move did, and what unmake_move needs to take it back.
+    records can be reused: pass one back into make_move to avoid allocating a new one.
+    """
+    __slots__ = ('cells', 'side', 'hole', 'next_side', 'seeds_added_to_store',
+                 'captured', 'extra_turn', 'game_over')
+
+    def __init__(self):
+        self.cells: List[int] = [0] * PackedBoard.CELLS  # the cells before the move
+        self.side: Optional[Side] = None
+        self.hole: int = 0
+        self.next_side: Optional[Side] = None  # arbitrary if the game is over
+        self.seeds_added_to_store: int = 0  # to the mover's store
+        self.captured: bool = False
+        self.extra_turn: bool = False  # the last seed went into the mover's store
+        self.game_over: bool = False
+
+    def __str__(self) -> str:
+        return "side={} hole={} next_side={} added={} captured={} extra_turn={} game_over={}".format(
+            self.side, self.hole, self.next_side, self.seeds_added_to_store,
+            self.captured, self.extra_turn, self.game_over
+        )
+
+
+def side_offset(side: Side) -> int:
+    return NORTH_OFFSET if side == Side.NORTH else SOUTH_OFFSET
+
+
+def holes_empty(cells: List[int], side: Side) -> bool:
+    offset = side_offset(side)
+    return not any(cells[offset + 1:offset + HOLES + 1])
+
+
+def game_over(cells: List[int]) -> bool:
+    return holes_empty(cells, Side.NORTH) or holes_empty(cells, Side.SOUTH)
+
+
+def legal_moves(cells: List[int], side: Side) -> List[int]:
+    """
+    :return: the indices (1 to 7) of the non-empty holes of the side.
+    """
+    offset = side_offset(side)
+    return [hole for hole in range(1, HOLES + 1) if cells[offset + hole]]
+
+
+def make_move(cells: List[int], hole: int, side: Side, record: MoveRecord = None) -> MoveRecord:
+    """
+    sows the seeds of the given hole in place, including captures and the
+    collection of the remaining seeds when the move ends the game.
+    The move must be legal. The pie rule is not handled here; that is up to the caller.
+    :param cells: 16 cells in the PackedBoard layout. modified in place.
+    :param hole: 1 to 7
+    :param side: the side making the move
+    :param record: an optional record to fill in, instead of allocating a new one.
+    :return: the undo record of the move.
+    """
+    if record is None:
+        record = MoveRecord()
+    record.cells[:] = cells
+    offset = side_offset(side)
+    opp_offset = SOUTH_OFFSET - offset
+    store_before = cells[offset]
+
+    # pick seeds
+    seeds_to_sow = cells[offset + hole]
+    cells[offset + hole] = 0
+    rounds, extra = divmod(seeds_to_sow, RECEIVING_PITS)
+    # sow the seeds of the full rounds (if any)
+    if rounds:
+        for idx in range(1, HOLES + 1):
+            cells[offset + idx] += rounds
+            cells[opp_offset + idx] += rounds
+        cells[offset] += rounds
+    # sow the extra seeds (last round). sow_hole 0 means the store.
+    sow_offset = offset
+    sow_hole = hole
+    while extra:
+        extra -= 1
+        sow_hole += 1
+        if sow_hole == 1:  # last pit was a store
+            sow_offset = SOUTH_OFFSET - sow_offset
+        if sow_hole > HOLES:
+            if sow_offset == offset:
+                sow_hole = 0  # sow to the store now
+                cells[offset] += 1
+                continue
+            else:
+                sow_offset = SOUTH_OFFSET - sow_offset
+                sow_hole = 1
+        cells[sow_offset + sow_hole] += 1
+
+    # capture: the last seed landed in an empty hole of the mover, and the opposite hole is non-empty
+    captured = False
+    if sow_offset == offset and sow_hole > 0 and cells[offset + sow_hole] == 1:
+        opposite_idx = opp_offset + HOLES + 1 - sow_hole
+        if cells[opposite_idx] > 0:
+            cells[offset] += 1 + cells[opposite_idx]
+            cells[offset + sow_hole] = 0
+            cells[opposite_idx] = 0
+            captured = True
+
+    # game over? the other side collects its remaining seeds.
+    finished = False
+    collecting_offset = None
+    if not any(cells[offset + 1:offset + HOLES + 1]):
+        collecting_offset = opp_offset
+    elif not any(cells[opp_offset + 1:opp_offset + HOLES + 1]):
+        collecting_offset = offset
+    if collecting_offset is not None:
+        finished = True
+        seeds = 0
+        for idx in range(collecting_offset + 1, collecting_offset + HOLES + 1):
+            seeds += cells[idx]
+            cells[idx] = 0
+        cells[collecting_offset] += seeds
+
+    record.side = side
+    record.hole = hole
+    record.extra_turn = sow_hole == 0
+    record.next_side = side if sow_hole == 0 else side.opposite()
+    record.seeds_added_to_store = cells[offset] - store_before
+    record.captured = captured
+    record.game_over = finished
+    return record
+
+
+def unmake_move(cells: List[int], record: MoveRecord):
+    """
+    restores the cells to what they were before the recorded move.
+    """
+    cells[:] = record.cells
+
+
+def pie_next_side(record: MoveRecord, moves: int) -> Side:
+    # the 1st move never earns an extra turn (pie rule)
+    return record.side.opposite() if moves == 0 else record.next_side
+
+
+def children(position: Position) -> List[Tuple[Action, Optional[Position]]]:
+    """
+    :return: every move from the position, and where it leads (None if the game is over after it).
+    """
+    cells, side, moves = position
+    result = list()
+    if moves == 1:
+        # swap: the board stays, and north moves next
+        result.append((Action.SWAP, (cells, Side.NORTH, 2)))
+    for hole in legal_moves(cells, side):
+        child = list(cells)
+        record = make_move(child, hole, side)
+        result.append((Action(hole), None if record.game_over else (tuple(child), pie_next_side(record, moves),
+                                                                    min(moves + 1, 2))))
+    return result
@@ -72,6 +72,13 @@ class KalahEnvState(Enum):
     GAME_ENDS = auto()
 
 
+class SearchMode(Enum):
+    # copies a GameNode (deepcopy) for every child
+    LEGACY = auto()
+    # makes & unmakes moves on one mutable board
+    MAKE_UNMAKE = auto()
+
+
 class Side(Enum):
     NORTH = auto()
     SOUTH = auto()
@@ -1,8 +1,9 @@
 from dataclasses import dataclass
-from typing import Tuple, Union
+from typing import Dict, List, Sequence, Tuple, Union
 import numpy as np
 from kalah_python.utils.agents import Agent
-from kalah_python.utils.board import Board
+from kalah_python.utils.board import Board, PackedBoard
+from kalah_python.utils.engine import make_move, legal_moves
 from kalah_python.utils.enums import KalahEnvState, Action, Side, AgentState
 import logging
 from sys import stdout
@@ -303,57 +304,11 @@ class KalahEnv:
         :param: side: the current side of the agent
         :return: state, reward and done.
         """
-        hole = action.value
-
-        seeds_added_to_store = 0
-        seeds_to_sow = board.hole(hole, side)
-        board.set_hole(hole, side, 0)
-
-        holes = Board.HOLES_PER_SIDE  # you can directly access to the static var
-        receiving_pits = 2 * holes + 1
-        rounds = seeds_to_sow // receiving_pits  # floor() : truncate the floating points
-        extra = seeds_to_sow % receiving_pits  # the first "extra" number of holes get "rounds"+1 seeds,
-        # the remaining ones get "rounds" seeds
-        # sow the seeds of the full rounds (if any):
-        if rounds != 0:
-            for hole in range(1, holes + 1):
-                board.add_seeds_to_hole(hole, side, rounds)
-                board.add_seeds_to_hole(hole, side.opposite(), rounds)
-            board.add_seeds_to_store(side, rounds)
-        # sow the extra seeds
-        sow_side = side
-        sow_hole = hole
-        for extra in reversed(range(1, extra + 1)):
-            sow_hole = sow_hole + 1
-            if sow_hole == 1:  # last pit was a store sow_side = sow_side.opposite()
-                sow_side = sow_side.opposite()
-            if sow_hole > holes:
-                if sow_side == side:
-                    sow_hole = 0
-                    board.add_seeds_to_store(sow_side, 1)
-                    seeds_added_to_store += 1
-                    continue
-                else:
-                    sow_side = sow_side.opposite()
-                    sow_hole = 1
-            board.add_seeds_to_hole(sow_hole, sow_side, 1)
-
-        # capture:
-        if sow_side == side \
-                and sow_hole > 0 \
-                and board.hole(sow_hole, sow_side) == 1 \
-                and board.opposite_hole(sow_hole, sow_side) > 0:
-            board.add_seeds_to_store(side, 1 + board.opposite_hole(sow_hole, sow_side))
-            seeds_added_to_store += 1 + board.opposite_hole(sow_hole, sow_side)
-            board.set_hole(sow_hole, side, 0)
-            board.set_hole(board.opposite_hole_idx(sow_hole), side.opposite(), 0)
-
-        # game over (game ends)?
-        finished_side = None
-        if not board.nonzero_holes(side):
-            finished_side = side
-        elif not board.nonzero_holes(side.opposite()):
-            finished_side = side.opposite()
+        # sow on the packed cells with the shared move engine, and load the result back into the board
+        cells = list(board.pack().cells)
+        record = make_move(cells, action.value, side)
+        board.unpack(PackedBoard(cells))
+        seeds_added_to_store = record.seeds_added_to_store
 
         if side == Side.NORTH:
             player_board = board.south_board
@@ -362,19 +317,13 @@ class KalahEnv:
             player_board = board.north_board
             opp_board = board.south_board
 
-        if finished_side:
-            seeds = 0
-            collecting_side = finished_side.opposite()
-            for hole in range(1, holes + 1):
-                seeds = seeds + board.hole(hole, collecting_side)
-                board.set_hole(hole, collecting_side, 0)
-            board.add_seeds_to_store(collecting_side, seeds)
-            seeds_added_to_store += seeds
+        if record.game_over:
             # here, we are not returning game over, but returning
             # game_ends
             return KalahEnvState.GAME_ENDS, MoveResult(seeds_added_to_store, player_board, opp_board)
         # your store minus opponent's store at the move
-        if sow_hole == 0 and agent_state != AgentState.DECIDE_ON_1ST_MOVE:
+        # (the 1st move of the game never earns an extra turn, because of the pie rule)
+        if record.extra_turn and agent_state != AgentState.DECIDE_ON_1ST_MOVE:
             if side == Side.SOUTH:
                 return KalahEnvState.SOUTH_TURN, MoveResult(seeds_added_to_store, player_board, opp_board)
             else:
@@ -393,6 +342,84 @@ class KalahEnv:
         print(self.board)
 
 
+class HeadlessKalahEnv:
+    """
+    plays games between two agents by asking them for actions directly
+    (decide_on_action, with the legal actions and the pie rule), without raising
+    the triggers of their state machines. That protocol only matters to the network server;
+    for self-play and evaluation, it costs more than the game itself.
+    The agents' boards and sides are kept up to date, but their states are not.
+    """
+
+    def __init__(self, agent_1st: Agent, agent_2nd: Agent, check_invariants: bool = True):
+        """
+        :param agent_1st: starts on the south side, and makes the 1st move.
+        :param agent_2nd: starts on the north side, and may swap sides on the 2nd move.
+        :param check_invariants: check that the seeds add up, and that every action is legal.
+        """
+        self.agent_1st = agent_1st
+        self.agent_2nd = agent_2nd
+        self.check_invariants = check_invariants
+        self.cells: List[int] = list(PackedBoard.INIT_CELLS)
+        self.moves: int = 0
+
+    def play_game(self, opening: Sequence[int] = ()) -> GameResult:
+        """
+        :param opening: holes to play for the agents on the first moves of the game (e.g. to vary
+        the games between deterministic agents). The agents decide on the moves after it.
+        An opening of more than one move takes the swap decision away from the 2nd agent.
+        """
+        self.cells[:] = PackedBoard.INIT_CELLS
+        self.moves = 0
+        self.agent_1st.side = Side.SOUTH
+        self.agent_2nd.side = Side.NORTH
+        agents = {Side.SOUTH: self.agent_1st, Side.NORTH: self.agent_2nd}
+        side = Side.SOUTH
+        while True:
+            agent = agents[side]
+            agent.board.unpack(PackedBoard(self.cells))
+            possible_actions = [Action(hole) for hole in legal_moves(self.cells, side)]
+            if self.moves == 1:
+                possible_actions.append(Action.SWAP)
+            if self.moves < len(opening):
+                action = Action(opening[self.moves])
+            else:
+                action = agent.decide_on_action(possible_actions)
+            if self.check_invariants and action not in possible_actions:
+                raise ValueError("illegal action: " + str(action))
+            if agent.buffer:
+                agent.action_buffer.append(action)
+            self.moves += 1
+            if action == Action.SWAP:
+                # the board stays; the agents trade sides, and north moves next.
+                agents[Side.SOUTH], agents[Side.NORTH] = agents[Side.NORTH], agents[Side.SOUTH]
+                agents[Side.SOUTH].side, agents[Side.NORTH].side = Side.SOUTH, Side.NORTH
+                continue
+            record = make_move(self.cells, action.value, side)
+            if self.check_invariants and sum(self.cells) != 98:
+                raise ValueError("Should be 98 but was: " + str(sum(self.cells)))
+            if record.game_over:
+                break
+            # (the 1st move of the game never earns an extra turn, because of the pie rule)
+            if not record.extra_turn or self.moves == 1:
+                side = side.opposite()
+        return self.game_result(agents)
+
+    def game_result(self, agents: Dict[Side, Agent]) -> GameResult:
+        board = PackedBoard(self.cells).to_board()
+        for agent in agents.values():
+            agent.board.unpack(PackedBoard(self.cells))
+        south_offset = board.store_offset(Side.SOUTH)
+        if south_offset > 0:
+            return GameResult(draw=False, win_score=south_offset, winner=agents[Side.SOUTH],
+                              loser=agents[Side.NORTH], board=board)
+        elif south_offset < 0:
+            return GameResult(draw=False, win_score=-south_offset, winner=agents[Side.NORTH],
+                              loser=agents[Side.SOUTH], board=board)
+        else:
+            return GameResult(draw=True, win_score=0, winner=None, loser=None, board=board)
+
+
 # class ACKalahEnv(KalahEnv):
 #
 #     def __init__(self, board: Board,
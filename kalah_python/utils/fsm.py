@@ -0,0 +1,95 @@
+"""
+A table-driven state machine, compiled once from a transitions-style list
+(e.g. Agent.TRANSITIONS) and shared by all the models of a class.
+It replaces transitions.Machine, which builds a machine per instance and
+dispatches (and logs) every trigger dynamically.
+Supported: [trigger, source, dest] lists, dicts with 'before' and 'after' callbacks,
+'*' (from any state) sources, and '=' (reflexive) destinations.
+The callbacks run in the order transitions runs them: before, on_exit_<source>, on_enter_<dest>, after.
+(check_fsm compares the two machines on random trigger sequences.)
+"""
+from enum import Enum
+from typing import Callable, Dict, List, Optional, Tuple, Type, Union
+
+
+class MachineError(ValueError):
+    """
+    raised when a trigger is not valid from the current state.
+    """
+    pass
+
+
+class StateMachine:
+
+    def __init__(self, states: Type[Enum], transitions: List[Union[list, dict]], initial: Enum):
+        """
+        :param states: the states. They become their indices in the enum, in the models' state_idx.
+        :param transitions: [trigger, source, dest] or {'trigger', 'source', 'dest', 'before', 'after'}
+        :param initial: the state of a new model.
+        """
+        self.states: Tuple[Enum, ...] = tuple(states)
+        self.initial: int = self.states.index(initial)
+        index = {state: idx for idx, state in enumerate(self.states)}
+        # trigger -> the (dest, before, after) transition from every state. None where the trigger is invalid.
+        self.table: Dict[str, List[Optional[Tuple[int, Optional[str], Optional[str]]]]] = dict()
+        for transition in transitions:
+            if isinstance(transition, dict):
+                trigger, source, dest = transition['trigger'], transition['source'], transition['dest']
+                before, after = transition.get('before'), transition.get('after')
+            else:
+                trigger, source, dest = transition
+                before = after = None
+            row = self.table.setdefault(trigger, [None] * len(self.states))
+            if source == '*':
+                sources = range(len(self.states))
+            else:
+                sources = [index[state] for state in (source if isinstance(source, list) else [source])]
+            for src in sources:
+                if row[src] is None:  # the first transition added wins, as in transitions
+                    row[src] = (src if dest == '=' else index[dest], before, after)
+        # model class -> its on_enter_* and on_exit_* functions, by state index
+        self.callbacks: Dict[type, Tuple[List[Optional[Callable]], List[Optional[Callable]]]] = dict()
+
+    def bind(self, cls: type):
+        """
+        adds a method per trigger to the model class.
+        Models keep the index of their state in state_idx (initially self.initial).
+        """
+        for trigger in self.table:
+            setattr(cls, trigger, self._trigger_method(trigger))
+
+    def callbacks_of(self, cls: type) -> Tuple[List[Optional[Callable]], List[Optional[Callable]]]:
+        callbacks = self.callbacks.get(cls)
+        if callbacks is None:
+            callbacks = (
+                [getattr(cls, "on_enter_" + state.name, None) for state in self.states],
+                [getattr(cls, "on_exit_" + state.name, None) for state in self.states]
+            )
+            self.callbacks[cls] = callbacks
+        return callbacks
+
+    def _trigger_method(self, trigger: str) -> Callable:
+        row = self.table[trigger]
+        states = self.states
+        callbacks_of = self.callbacks_of
+
+        def fire(model) -> bool:
+            src = model.state_idx
+            transition = row[src]
+            if transition is None:
+                raise MachineError("Can't trigger event {} from state {}!".format(trigger, states[src].name))
+            dest, before, after = transition
+            on_enter, on_exit = callbacks_of(type(model))
+            if before:
+                getattr(model, before)()
+            if on_exit[src]:
+                on_exit[src](model)
+            model.state_idx = dest
+            if on_enter[dest]:
+                on_enter[dest](model)
+            if after:
+                getattr(model, after)()
+            return True
+
+        fire.__name__ = trigger
+        return fire
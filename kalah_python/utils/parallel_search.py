@@ -0,0 +1,227 @@
+"""
+The minimax search of the root, split over a pool of processes (young brothers wait).
+Every iteration of the iterative deepening searches the eldest brother (the best action of the last
+iteration) first, on the calling process, and then its younger brothers all at once, one per worker.
+The workers share alpha (the best value of the root so far): each of them reads it before it starts on
+an action, and raises it when it finds a better one.
+
+A worker proves an action worse with a null window just below alpha, and searches it again with a
+window open above only if that fails. So every action that is as good as the best one gets an exact
+value, whatever the order the workers finish in, and the best action is the one with the highest exact
+value (the first in root order of equally good ones), as it is in MiniMaxSearch.
+
+Every worker keeps its own MiniMaxSearch, and so its own transposition table, between actions and
+between moves. Its settings (and its tablebase) are those of the searchers that use the pool.
+"""
+from multiprocessing import Pool
+from typing import Optional, List, Tuple
+import itertools
+import multiprocessing
+import os
+import threading
+import time
+
+from kalah_python.utils.board import PackedBoard
+from kalah_python.utils.enums import Action, Side
+from kalah_python.utils.search import MiniMaxSearch, INF, NULL_WINDOW
+from kalah_python.utils.tablebase import Tablebase
+
+# the state of this (worker) process, set by _init_worker
+_searcher: Optional[MiniMaxSearch] = None
+_alpha = None  # multiprocessing.Value('d')
+_stop = None  # multiprocessing.Event
+_search_id: int = -1
+
+
+def _init_worker(searcher_kwargs: dict, tablebase_path: Optional[str], alpha, stop):
+    global _searcher, _alpha, _stop
+    tablebase = Tablebase(tablebase_path) if tablebase_path else None
+    _searcher = MiniMaxSearch(tablebase=tablebase, **searcher_kwargs)
+    _alpha = alpha
+    _stop = stop
+
+
+def _search_action(task: Tuple[int, Tuple[int, ...], Side, Action, int, Optional[float]]) \
+        -> Tuple[Action, Optional[float], bool, int, bool]:
+    """
+    :param task: the id of the search, the root (cells and side), the action, the depth, and the deadline
+    (time.time(), which all the processes share), if any.
+    :return: the action, its value (None if the search was stopped), whether the value is exact (else it is
+    an upper bound below alpha), the nodes searched, and whether the search reached the horizon.
+    """
+    global _search_id
+    search_id, cells, side, action, depth, deadline = task
+    if search_id != _search_id:
+        # a new decision
+        _search_id = search_id
+        _searcher.tt.new_search()
+        _searcher._age_move_ordering()
+    board = PackedBoard(cells)
+    alpha = _alpha.value
+    time_budget = None if deadline is None else deadline - time.time()
+    # is it as good as alpha? (values are multiples of 0.05, so this tells >= alpha from < alpha)
+    value = _searcher.action_value(board, side, action, depth, alpha - NULL_WINDOW, alpha, time_budget, _stop)
+    nodes, horizon_reached = _searcher.nodes, _searcher.horizon_reached
+    exact = False
+    if value is not None and value > alpha - NULL_WINDOW:
+        alpha = max(alpha, _alpha.value)
+        time_budget = None if deadline is None else deadline - time.time()
+        value = _searcher.action_value(board, side, action, depth, alpha - NULL_WINDOW, INF, time_budget, _stop)
+        nodes += _searcher.nodes
+        horizon_reached = horizon_reached or _searcher.horizon_reached
+        if value is not None and value > alpha - NULL_WINDOW:
+            exact = True
+            with _alpha.get_lock():
+                if value > _alpha.value:
+                    _alpha.value = value
+    return action, value, exact, nodes, horizon_reached
+
+
+class SearchPool:
+    """
+    the worker processes of parallel searches, with the alpha and the stop flag they share.
+    Make one per host and give it to all the agents: the processes start on first use (so, in the
+    process that searches), and only one search at a time can use them.
+    The workers search as the searchers that use the pool do, so these must all have the same settings.
+    """
+
+    def __init__(self, processes: Optional[int] = None):
+        """
+        :param processes: the workers. defaults to one per core.
+        """
+        self.processes = processes or os.cpu_count()
+        # the settings of the workers' MiniMaxSearch, from the searchers (see configure)
+        self.searcher_kwargs: Optional[dict] = None
+        self.tablebase_path: Optional[str] = None  # the workers map the tablebase themselves
+        self.pool: Optional[Pool] = None
+        self.alpha = None
+        self.stop = None
+        self.lock = threading.Lock()
+        self.search_ids = itertools.count()
+
+    def configure(self, searcher_kwargs: dict, tablebase_path: Optional[str]):
+        """
+        sets the settings of the workers' MiniMaxSearch, on the first call.
+        :raises ValueError: if a searcher with other settings already uses the pool.
+        """
+        if self.searcher_kwargs is None:
+            self.searcher_kwargs, self.tablebase_path = dict(searcher_kwargs), tablebase_path
+        elif (self.searcher_kwargs, self.tablebase_path) != (searcher_kwargs, tablebase_path):
+            raise ValueError("the search pool searches with {} (tablebase: {}), not with {} (tablebase: {})".format(
+                self.searcher_kwargs, self.tablebase_path, searcher_kwargs, tablebase_path))
+
+    def start(self):
+        if self.pool is not None:
+            return
+        if self.searcher_kwargs is None:
+            raise ValueError("no searcher uses the search pool: there are no settings to start the workers with")
+        self.alpha = multiprocessing.Value('d', -INF)
+        self.stop = multiprocessing.Event()
+        self.pool = Pool(self.processes, initializer=_init_worker,
+                         initargs=(self.searcher_kwargs, self.tablebase_path, self.alpha, self.stop))
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+
+
+class ParallelSearch(MiniMaxSearch):
+    """
+    MiniMaxSearch, with the younger brothers of the root searched over a SearchPool.
+    It searches on its own (as MiniMaxSearch does) when the root has one action, when the tablebase
+    covers the root (and SWAP is not one of its actions), or when another search is using the pool.
+    """
+    # poll for stop_event this often (seconds) while the workers search
+    POLL_INTERVAL: float = 0.005
+
+    def __init__(self, search_pool: SearchPool, **kwargs):
+        """
+        :param search_pool: the workers.
+        :param kwargs: of MiniMaxSearch, for the searches of the eldest brothers (and the searches on its own),
+        and for the workers' (but the depth, which they get with every action).
+        :raises ValueError: if the pool searches with other settings.
+        """
+        super().__init__(**kwargs)
+        self.search_pool = search_pool
+        search_pool.configure({key: value for key, value in kwargs.items() if key not in ('depth', 'tablebase')},
+                              self.tablebase.path if self.tablebase is not None else None)
+
+    def search(self, board: PackedBoard, side: Side, possible_actions: List[Action],
+               time_budget: Optional[float] = None, depth: Optional[int] = None,
+               stop_event: Optional[threading.Event] = None) -> Tuple[Action, float]:
+        """
+        as MiniMaxSearch.search. With a fixed depth, it deepens iteratively to it (the eldest brothers
+        need the order of the iterations before).
+        """
+        pool = self.search_pool
+        # the root shortcut of MiniMaxSearch.search: the tablebase covers the root, and there is no swap to weigh
+        tablebase_root = self.tablebase is not None and self.tablebase.covers(board.cells) \
+            and Action.SWAP not in possible_actions
+        if len(possible_actions) == 1 or tablebase_root or not pool.lock.acquire(blocking=False):
+            return super().search(board, side, possible_actions, time_budget, depth, stop_event)
+        try:
+            pool.start()
+            pool.stop.clear()
+            return self._parallel_search(board, side, possible_actions, time_budget, depth or self.depth,
+                                         stop_event)
+        finally:
+            pool.lock.release()
+
+    def _parallel_search(self, board: PackedBoard, side: Side, possible_actions: List[Action],
+                         time_budget: Optional[float], max_depth: int,
+                         stop_event: Optional[threading.Event]) -> Tuple[Action, float]:
+        pool = self.search_pool
+        search_id = next(pool.search_ids)
+        self.tt.new_search()
+        self._age_move_ordering()
+        total_nodes = 0
+        self.depth_reached = 0
+        start = time.perf_counter()
+        best_action, best_value = possible_actions[0], 0.0
+        if time_budget is None:
+            max_depth = min(max_depth, self.max_depth)
+        else:
+            max_depth = self.max_depth
+        for depth in range(1, max_depth + 1):
+            remaining = None if time_budget is None else time_budget - (time.perf_counter() - start)
+            # the eldest brother, here
+            eldest = possible_actions[0]
+            eldest_value = self.action_value(board, side, eldest, depth, time_budget=remaining,
+                                             stop_event=stop_event)
+            total_nodes += self.nodes
+            horizon_reached = self.horizon_reached
+            if eldest_value is None:
+                break
+            # the younger brothers, over the pool
+            pool.alpha.value = eldest_value
+            deadline = None if time_budget is None else time.time() + time_budget - (time.perf_counter() - start)
+            tasks = [(search_id, board.cells, side, action, depth, deadline) for action in possible_actions[1:]]
+            pending = pool.pool.map_async(_search_action, tasks)
+            while not pending.ready():
+                pending.wait(ParallelSearch.POLL_INTERVAL)
+                if stop_event is not None and stop_event.is_set():
+                    pool.stop.set()
+            results = pending.get()
+            total_nodes += sum(result[3] for result in results)
+            if any(result[1] is None for result in results):
+                # stopped mid-iteration: keep the last complete one (or the eldest, if there is none)
+                if not self.depth_reached:
+                    best_action, best_value = eldest, eldest_value
+                break
+            # the highest exact value, the first in root order of equally good ones
+            best_action, best_value = eldest, eldest_value
+            for action, value, exact, _, younger_horizon in results:
+                horizon_reached = horizon_reached or younger_horizon
+                if exact and value > best_value:
+                    best_action, best_value = action, value
+            self.depth_reached = depth
+            if not horizon_reached:
+                break  # the whole game tree fits in this depth
+            if time_budget is not None and time.perf_counter() - start > time_budget * MiniMaxSearch.SOFT_STOP:
+                break
+            possible_actions = [best_action] + [action for action in possible_actions if action != best_action]
+        self.nodes = total_nodes
+        return best_action, best_value
+
@@ -0,0 +1,186 @@
+"""
+perft: counts the positions at depth d of the game tree, to check (and time) move generation.
+A ply is a move of one side, so extra turns add plies of the same side. The 2nd move of the game
+may be a swap (pie rule), and the 1st move never earns an extra turn.
+Games that end before depth d add nothing, as in chess perft.
+A position is (cells, side to move, moves made so far). Only whether 0, 1 or more moves were made matters.
+"""
+from multiprocessing import Pool
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+
+from kalah_python.utils.batch_env import BatchKalahEnv, NORTH, SOUTH, SWAP
+from kalah_python.utils.board import Board, PackedBoard
+from kalah_python.utils.engine import MoveRecord, Position, children, make_move, unmake_move, side_offset, \
+    pie_next_side
+from kalah_python.utils.enums import Action, AgentState, KalahEnvState, Side
+from kalah_python.utils.env import KalahEnv
+
+HOLES = range(1, Board.HOLES_PER_SIDE + 1)
+
+# name -> (position, the reference counts at depths 1, 2, ...)
+POSITIONS: Dict[str, Tuple[str, List[int]]] = {
+    "start": ("0,7,7,7,7,7,7,7,0,7,7,7,7,7,7,7;S;0",
+              [7, 56, 364, 2388, 15653, 101884, 664602, 4287250, 27648341]),
+    # after south's 1st move: north may swap
+    "pie": ("0,8,8,7,7,7,7,7,1,7,7,0,8,8,8,8;N;1",
+            [8, 53, 350, 2279, 14875, 96582, 622789, 4010564, 25525839]),
+    "middlegame": ("5,3,15,13,6,0,0,3,5,1,7,3,13,3,6,15;S;12",
+                   [7, 39, 244, 1491, 9294, 58026, 360039, 2246824, 13952359]),
+    # a hole with more than a lap of seeds
+    "laps": ("26,0,5,19,3,0,3,15,11,3,7,0,1,0,2,3;S;20",
+             [5, 25, 136, 749, 4344, 25280, 148087, 865623, 5019309, 29005967]),
+    "endgame": ("46,0,1,1,1,1,1,2,40,1,1,1,0,1,1,0;S;40",
+                [5, 29, 123, 553, 2003, 6655, 20907, 55598, 149746, 361223, 859680, 2003609]),
+}
+
+
+def parse_position(text: str) -> Position:
+    """
+    e.g. 0,7,7,7,7,7,7,7,0,7,7,7,7,7,7,7;S;0
+    the 16 cells in the PackedBoard layout, the side to move (N or S), and the moves made so far.
+    """
+    cells, side, moves = text.strip().split(";")
+    cells = tuple(int(seeds) for seeds in cells.split(","))
+    if len(cells) != PackedBoard.CELLS:
+        raise ValueError("Invalid position:" + text)
+    if side not in ("N", "S"):
+        raise ValueError("Invalid side:" + side)
+    return cells, Side.SOUTH if side == "S" else Side.NORTH, int(moves)
+
+
+def format_position(position: Position) -> str:
+    cells, side, moves = position
+    return "{};{};{}".format(",".join(str(seeds) for seeds in cells), "S" if side == Side.SOUTH else "N", moves)
+
+
+class Perft:
+    """
+    perft on one mutable list of cells, with make_move & unmake_move (the engine of the search).
+    """
+
+    def __init__(self):
+        self.cells: List[int] = list(PackedBoard.INIT_CELLS)
+        self.records: List[MoveRecord] = list()
+
+    def count(self, position: Position, depth: int) -> int:
+        cells, side, moves = position
+        self.cells[:] = cells
+        self.records = [MoveRecord() for _ in range(depth + 1)]
+        return self._perft(side, min(moves, 2), depth)
+
+    def _perft(self, side: Side, moves: int, depth: int) -> int:
+        if depth == 0:
+            return 1
+        cells = self.cells
+        nodes = 0
+        if moves == 1:
+            nodes += self._perft(Side.NORTH, 2, depth - 1)
+        offset = side_offset(side)
+        for hole in HOLES:
+            if not cells[offset + hole]:
+                continue
+            if depth == 1:
+                nodes += 1  # a leaf, whatever the move does
+                continue
+            record = make_move(cells, hole, side, self.records[depth])
+            if not record.game_over:
+                nodes += self._perft(pie_next_side(record, moves), min(moves + 1, 2), depth - 1)
+            unmake_move(cells, record)
+        return nodes
+
+
+def perft_env(position: Position, depth: int) -> int:
+    """
+    perft with KalahEnv.execute_move on Boards (the engine of the environment). Slow; to cross-check.
+    """
+    cells, side, moves = position
+    return _perft_env(PackedBoard(cells).to_board(), side, min(moves, 2), depth)
+
+
+def _perft_env(board: Board, side: Side, moves: int, depth: int) -> int:
+    if depth == 0:
+        return 1
+    nodes = 0
+    if moves == 1:
+        nodes += _perft_env(board, Side.NORTH, 2, depth - 1)
+    agent_state = AgentState.DECIDE_ON_1ST_MOVE if moves == 0 else AgentState.DECIDE_ON_MOVE
+    for hole in board.nonzero_holes(side):
+        if depth == 1:
+            nodes += 1
+            continue
+        child = board.pack().to_board()
+        env_state, _ = KalahEnv.execute_move(Action(hole), child, side, agent_state)
+        if env_state != KalahEnvState.GAME_ENDS:
+            next_side = Side.SOUTH if env_state == KalahEnvState.SOUTH_TURN else Side.NORTH
+            nodes += _perft_env(child, next_side, min(moves + 1, 2), depth - 1)
+    return nodes
+
+
+def perft_batch(position: Position, depth: int) -> int:
+    """
+    perft with BatchKalahEnv, one level of the tree at a time. (an engine of its own, so a good cross-check)
+    Memory grows with the width of the tree: keep depth small.
+    """
+    cells, side, moves = position
+    env = BatchKalahEnv(1)
+    env.reset(np.array([cells]))
+    env.side[:] = SOUTH if side == Side.SOUTH else NORTH
+    env.moves[:] = min(moves, 2)
+    for level in range(depth):
+        mask = env.legal_mask()
+        if level == depth - 1:
+            return int(mask.sum())
+        rows, cols = np.nonzero(mask)
+        child = BatchKalahEnv(rows.size)
+        child.cells[:] = env.cells[rows]
+        child.side[:] = env.side[rows]
+        child.moves[:] = env.moves[rows]
+        child.step(np.where(cols == 0, SWAP, cols))
+        # the games that ended have no more plies
+        live = ~child.done
+        env = BatchKalahEnv(int(live.sum()))
+        env.cells[:] = child.cells[live]
+        env.side[:] = child.side[live]
+        env.moves[:] = np.minimum(child.moves[live], 2)
+    return 1
+
+
+def _count(task: Tuple[Position, int]) -> int:
+    position, depth = task
+    return Perft().count(position, depth)
+
+
+def split(position: Position, depth: int, min_tasks: int) -> List[Tuple[Position, int]]:
+    """
+    splits the tree into subtrees, a level at a time, until there are at least min_tasks of them.
+    """
+    tasks = [(position, depth)]
+    while tasks and len(tasks) < min_tasks and tasks[0][1] > 1:
+        tasks = [(child, remaining - 1)
+                 for subtree, remaining in tasks
+                 for _, child in children(subtree) if child is not None]
+    return tasks
+
+
+def parallel_perft(position: Position, depth: int, processes: int) -> int:
+    """
+    counts the subtrees on a pool of processes.
+    """
+    if processes <= 1 or depth <= 1:
+        return Perft().count(position, depth)
+    with Pool(processes) as pool:
+        return sum(pool.imap_unordered(_count, split(position, depth, 4 * processes)))
+
+
+def divide(position: Position, depth: int) -> Dict[str, int]:
+    """
+    :return: the count below every move of the position. (to find where two engines differ)
+    """
+    counts = dict()
+    for action, child in children(position):
+        if depth == 1:
+            counts[str(action)] = 1
+        else:
+            counts[str(action)] = Perft().count(child, depth - 1) if child else 0
+    return counts
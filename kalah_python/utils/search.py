@@ -0,0 +1,536 @@
+from typing import Dict, List, Optional, Tuple
+import threading
+import time
+
+from kalah_python.utils.board import Board, PackedBoard
+from kalah_python.utils.engine import MoveRecord, make_move, unmake_move, side_offset, legal_moves
+from kalah_python.utils.enums import Action, Side
+from kalah_python.utils.tablebase import Tablebase
+from kalah_python.utils.tt import TranspositionTable, zobrist_key
+
+INF = float('inf')
+HOLES = range(1, Board.HOLES_PER_SIDE + 1)
+# the order to try the holes in, given the best move found so far (0 = none)
+MOVE_ORDERS: List[Tuple[int, ...]] = [
+    (best_move,) * (best_move > 0) + tuple(hole for hole in HOLES if hole != best_move)
+    for best_move in range(Board.HOLES_PER_SIDE + 1)
+]
+# move ordering: the tiers of the sort keys. history scores stay below KILLER_SCORE
+EXTRA_TURN_SCORE: int = 1 << 26
+CAPTURE_SCORE: int = 1 << 25
+KILLER_SCORE: int = 1 << 24
+HISTORY_LIMIT: int = 1 << 20
+LAP: int = 2 * Board.HOLES_PER_SIDE + 1  # the pits a move sows into: all holes + the mover's store
+# the value of a proven win, plus the final lead. above any heuristic value
+TABLEBASE_WIN: float = 1000.0
+# the width of the null window of principal variation search. values are multiples of 0.05
+NULL_WINDOW: float = 0.01
+
+
+class SearchTimeout(Exception):
+    """
+    raised inside the tree when the deadline of an iterative deepening search has passed,
+    or when the search was asked to stop.
+    """
+    pass
+
+
+def evaluate_cells(cells: List[int], seeds_added_to_store: int, capturing_move: bool,
+                   last_seed_in_store: bool, side: Side, hole: int) -> float:
+    """
+    the heuristic value of a move, from the perspective of the side that made it.
+    :param cells: the cells after the move (PackedBoard layout)
+    :param seeds_added_to_store: seeds the move added to the mover's store
+    :param capturing_move: the move captured
+    :param last_seed_in_store: the move earned an extra turn
+    :param side: the side that made the move
+    :param hole: the hole the move was made from
+    :return:
+    """
+    offset = side_offset(side)
+    opp_offset = PackedBoard.SOUTH_OFFSET - offset
+    if capturing_move:
+        capture_value = 20
+    elif last_seed_in_store:
+        capture_value = 18
+    else:
+        capture_value = 0
+    score_difference = cells[offset] - cells[opp_offset]
+    hoard_value = sum(cells[offset + 1:offset + Board.HOLES_PER_SIDE + 1])
+    # reward playing the pits closest to the opponent
+    play_right_holes = 2 if hole > 4 else 0
+    opponent_store = cells[opp_offset]
+    return 0.25 * score_difference + 0.8 * capture_value + seeds_added_to_store + 0.3 * hoard_value \
+        + play_right_holes - 0.05 * opponent_store
+
+
+def exact_value(lead: int) -> float:
+    """
+    :param lead: the final difference of the stores, for a side
+    :return: the value of the game result, for that side
+    """
+    if lead > 0:
+        return TABLEBASE_WIN + lead
+    if lead < 0:
+        return -TABLEBASE_WIN + lead
+    return 0.0
+
+
+def tactical_score(cells: List[int], hole: int, offset: int) -> int:
+    """
+    guesses from the seeds alone (without making the move) whether it earns an extra turn or captures.
+    Exact for moves of less than a lap; longer ones only count when they end in the store.
+    :return: EXTRA_TURN_SCORE or CAPTURE_SCORE, plus something to tell them apart; 0 for a quiet move.
+    """
+    seeds = cells[offset + hole]
+    to_store = Board.HOLES_PER_SIDE + 1 - hole
+    if seeds % LAP == to_store:
+        # the holes closest to the store first: they sow over fewer of the other holes
+        return EXTRA_TURN_SCORE + hole
+    if seeds == LAP:
+        # a full lap, back into the emptied hole. the opposite hole got a seed as well
+        return CAPTURE_SCORE + 1 + cells[PackedBoard.SOUTH_OFFSET - offset + to_store]
+    if seeds < to_store:
+        last = hole + seeds
+    elif LAP - hole < seeds < LAP:
+        # around the other side, back to a hole left of the one that was played
+        last = hole + seeds - LAP
+    else:
+        return 0
+    if cells[offset + last]:
+        return 0
+    # the opposite hole (it got a seed too if the move went around)
+    captured = cells[PackedBoard.SOUTH_OFFSET - offset + Board.HOLES_PER_SIDE + 1 - last] + (seeds > to_store)
+    return CAPTURE_SCORE + captured if captured else 0
+
+
+class MiniMaxSearch:
+    """
+    alpha-beta minimax, in negamax form, that walks the tree on a single mutable list of cells.
+    Children are made and unmade in place with one preallocated MoveRecord per ply,
+    so expanding a node allocates nothing.
+    Every node is valued from the perspective of its side to move, and is negated on the way up
+    only when the side changes (not after an extra turn). Bounds are fail soft.
+    After the first move of a node, the others are searched with a null window (principal variation
+    search), and searched again with the full window only if they turn out to be better.
+    Iterative deepening searches every iteration in an aspiration window around the value of the
+    previous one.
+    At the horizon, a quiescence search goes on with the captures and extra turns only, until the
+    position is quiet (or a node limit is hit). Every node may stand pat: keep the value of the move
+    that led to it instead of playing on.
+    With an endgame tablebase, every move to a position it covers (and every move that ends the game)
+    gets its exact value instead, and a root it covers needs no search at all.
+    Positions are cached in a transposition table that is kept between searches.
+    Its values are for the side to move (a part of the key), so they stay valid when the root side
+    changes (e.g. after a swap).
+    Below the root, moves are tried in the order: the transposition table move, extra turns, captures,
+    the killer moves of the ply (the last two that caused a cutoff there), then by the history heuristic
+    (how often, and how deep, a hole of the side caused a cutoff anywhere in the tree).
+    """
+    MAX_PLY: int = 256
+    # check the clock every this many nodes (must be a power of 2, minus 1)
+    CLOCK_MASK: int = 1023
+    # don't start a new iteration once this fraction of the budget is used; it would not finish.
+    SOFT_STOP: float = 0.5
+    # the half width of the first aspiration window (a seed in the store is worth about 1.25)
+    ASPIRATION_WINDOW: float = 2.0
+    # widen the window to infinity once the half width reaches this
+    ASPIRATION_LIMIT: float = 32.0
+
+    def __init__(self, depth: int = 4, tt_size_mb: float = 16.0, max_depth: int = 64, move_ordering: bool = True,
+                 quiescence_nodes: int = 64, tablebase: Optional[Tablebase] = None):
+        """
+        :param depth: the search horizon, in plies, when there is no time budget.
+        (4 is the horizon of the legacy max_depth=3)
+        :param tt_size_mb: the memory cap of the transposition table.
+        :param max_depth: the deepest iteration of an iterative deepening search.
+        :param move_ordering: order the moves (see above). Otherwise, only the transposition table
+        move goes first, and the rest in hole order.
+        :param quiescence_nodes: the most nodes the quiescence search of one horizon leaf may visit.
+        0 turns it off: the horizon is a hard cut.
+        :param tablebase: the endgame tablebase to probe, if any.
+        """
+        self.depth = depth
+        self.max_depth = min(max_depth, MiniMaxSearch.MAX_PLY - 1)
+        self.tt = TranspositionTable(size_mb=tt_size_mb)
+        self.cells: List[int] = list(PackedBoard.INIT_CELLS)
+        self.records: List[MoveRecord] = [MoveRecord() for _ in range(MiniMaxSearch.MAX_PLY)]
+        self.nodes: int = 0
+        self.depth_reached: int = 0  # the deepest completed iteration of the last search
+        self.deadline: Optional[float] = None
+        self.stop_event: Optional[threading.Event] = None  # set it to abort the search
+        self.root_best: Optional[Tuple[Action, float]] = None  # the best root action so far
+        self.horizon_reached: bool = False  # some line was cut off by the depth (not by the game ending)
+        self.move_ordering = move_ordering
+        self.quiescence_nodes = quiescence_nodes
+        self.quiescence_budget: int = 0  # the nodes left to the quiescence search of the current leaf
+        self.tablebase = tablebase
+        self.tablebase_seeds: int = -1  # the search probes the tablebase once the stores hold this many
+        self.killers: List[List[int]] = [[0, 0] for _ in range(MiniMaxSearch.MAX_PLY)]
+        # side -> hole -> score (index 0 unused)
+        self.history: Dict[Side, List[int]] = {side: [0] * (Board.HOLES_PER_SIDE + 1) for side in Side}
+
+    def search(self, board: PackedBoard, side: Side, possible_actions: List[Action],
+               time_budget: Optional[float] = None, depth: Optional[int] = None,
+               stop_event: Optional[threading.Event] = None) -> Tuple[Action, float]:
+        """
+        :param board: the position to search from
+        :param side: the side to move, i.e. the side of the agent
+        :param possible_actions: the legal actions at the root (may include SWAP)
+        :param time_budget: seconds to search for. If given, the search deepens iteratively until
+        the budget runs out, and returns the result of the last completed depth.
+        Otherwise, it searches to a fixed depth.
+        :param depth: the fixed depth. defaults to self.depth
+        :param stop_event: setting it (from another thread) stops the search early. The search then
+        returns the best action it has found so far.
+        :return: the best action, and its value.
+        """
+        self.cells[:] = board.cells
+        self.nodes = 0
+        if self.tablebase is not None:
+            self.tablebase_seeds = sum(board.cells) - self.tablebase.max_seeds
+            if board.cells[PackedBoard.NORTH_OFFSET] + board.cells[PackedBoard.SOUTH_OFFSET] >= self.tablebase_seeds \
+                    and Action.SWAP not in possible_actions:
+                # the tablebase knows the value of every move: one ply is a perfect search
+                time_budget, depth = None, 1
+        self.root_best = (possible_actions[0], 0.0)
+        self.stop_event = stop_event
+        self.tt.new_search()
+        self._age_move_ordering()
+        start = time.perf_counter()
+        if time_budget is not None:
+            self.deadline = start + time_budget
+        best_action, best_value = None, 0.0
+        self.depth_reached = 0
+        try:
+            if time_budget is None:
+                best_action, best_value = self._search_root(side, possible_actions, depth or self.depth)
+                self.depth_reached = depth or self.depth
+            else:
+                for depth in range(1, self.max_depth + 1):
+                    if best_action is None:
+                        best_action, best_value = self._search_root(side, possible_actions, depth)
+                    else:
+                        best_action, best_value = self._aspiration_search(side, possible_actions, depth,
+                                                                          best_value)
+                    self.depth_reached = depth
+                    if not self.horizon_reached:
+                        break  # the whole game tree fits in this depth. deeper won't change anything
+                    if time.perf_counter() - start > time_budget * MiniMaxSearch.SOFT_STOP:
+                        break
+                    # search the best action first in the next iteration
+                    possible_actions = [best_action] + [action for action in possible_actions
+                                                        if action != best_action]
+        except SearchTimeout:
+            # the tree was left mid-move; put the root back
+            self.cells[:] = board.cells
+            if best_action is None:
+                # not even one depth was completed. go with what the root has seen so far
+                best_action, best_value = self.root_best
+        finally:
+            self.deadline = None
+            self.stop_event = None
+        return best_action, best_value
+
+    def action_value(self, board: PackedBoard, side: Side, action: Action, depth: int, alpha: float = -INF,
+                     beta: float = INF, time_budget: Optional[float] = None,
+                     stop_event: Optional[threading.Event] = None) -> Optional[float]:
+        """
+        searches a single root action to depth, in the window (alpha, beta). (a parallel search splits
+        the root with it)
+        :return: the value of the action for side (fail soft), or None if the search was stopped.
+        """
+        self.cells[:] = board.cells
+        self.nodes = 0
+        self.horizon_reached = False
+        if self.tablebase is not None:
+            self.tablebase_seeds = sum(board.cells) - self.tablebase.max_seeds
+        self.stop_event = stop_event
+        if time_budget is not None:
+            self.deadline = time.perf_counter() + time_budget
+        try:
+            return self._action_value(action, side, depth, alpha, beta)
+        except SearchTimeout:
+            self.cells[:] = board.cells
+            return None
+        finally:
+            self.deadline = None
+            self.stop_event = None
+
+    def ponder(self, board: PackedBoard, side: Side, results: Dict[PackedBoard, Tuple[Action, float, int]],
+               stop_event: threading.Event):
+        """
+        thinks on the opponent's time. Searches our replies to every move of the opponent,
+        one depth at a time (round robin), until stop_event is set. This also warms the
+        transposition table for the search that follows.
+        :param board: the position with the opponent to move
+        :param side: our side
+        :param results: filled with position after an opponent move -> (best action, value, depth)
+        :param stop_event:
+        """
+        opp_side = side.opposite()
+        cells = list(board.cells)
+        positions = list()
+        for hole in legal_moves(cells, opp_side):
+            record = make_move(cells, hole, opp_side)
+            # skip the moves that end the game, or give the opponent another turn
+            if not record.game_over and record.next_side == side:
+                positions.append(PackedBoard(cells))
+            unmake_move(cells, record)
+        for depth in range(1, self.max_depth + 1):
+            for position in positions:
+                possible_actions = [Action(hole) for hole in position.nonzero_holes(side)]
+                best_action, best_value = self.search(position, side, possible_actions,
+                                                      depth=depth, stop_event=stop_event)
+                if stop_event.is_set():
+                    return  # that search was cut short
+                results[position] = (best_action, best_value, depth)
+
+    def _age_move_ordering(self):
+        """
+        the killers are per ply, and the plies of the new search are not those of the last one.
+        history is kept, but weighs less.
+        """
+        for killers in self.killers:
+            killers[0] = killers[1] = 0
+        for scores in self.history.values():
+            for hole in HOLES:
+                scores[hole] >>= 2
+
+    def _ordered_moves(self, side: Side, tt_move: int, ply: int) -> List[int]:
+        """
+        :return: the legal moves of the side, best first. (see the class docstring)
+        """
+        cells = self.cells
+        offset = side_offset(side)
+        killer_1, killer_2 = self.killers[ply]
+        history = self.history[side]
+        scored = list()
+        for hole in HOLES:
+            if not cells[offset + hole] or hole == tt_move:
+                continue
+            score = tactical_score(cells, hole, offset)
+            if not score:
+                if hole == killer_1:
+                    score = KILLER_SCORE + 1
+                elif hole == killer_2:
+                    score = KILLER_SCORE
+                else:
+                    score = history[hole]
+            scored.append((score, hole))
+        scored.sort(reverse=True)
+        moves = [hole for _, hole in scored]
+        if tt_move and cells[offset + tt_move]:
+            moves.insert(0, tt_move)
+        return moves
+
+    def _cutoff(self, side: Side, hole: int, depth: int, ply: int):
+        """
+        remembers a move that caused a beta cutoff.
+        """
+        killers = self.killers[ply]
+        if killers[0] != hole:
+            killers[1] = killers[0]
+            killers[0] = hole
+        history = self.history[side]
+        history[hole] += depth * depth
+        if history[hole] > HISTORY_LIMIT:
+            for idx in HOLES:
+                history[idx] >>= 1
+
+    def _out_of_time(self) -> bool:
+        if self.stop_event is not None and self.stop_event.is_set():
+            return True
+        return self.deadline is not None and time.perf_counter() > self.deadline
+
+    def _search_root(self, side: Side, possible_actions: List[Action], depth: int,
+                     alpha: float = -INF, beta: float = INF) -> Tuple[Action, float]:
+        """
+        a principal variation search of the root actions, in the window (alpha, beta).
+        :return: the best action, and its value (fail soft: a bound if it is outside the window).
+        """
+        self.horizon_reached = False
+        best_action, best_value = None, -INF
+        for action in possible_actions:
+            if best_action is None:
+                value = self._action_value(action, side, depth, alpha, beta)
+            else:
+                value = self._action_value(action, side, depth, alpha, alpha + NULL_WINDOW)
+                if alpha < value < beta:
+                    value = self._action_value(action, side, depth, alpha, beta)
+            # keep the first of equally good actions
+            if best_action is None or value > best_value:
+                best_action, best_value = action, value
+                self.root_best = (best_action, best_value)
+                if best_value > alpha:
+                    alpha = best_value
+                    if alpha >= beta:
+                        break
+        return best_action, best_value
+
+    def _aspiration_search(self, side: Side, possible_actions: List[Action], depth: int,
+                           guess: float) -> Tuple[Action, float]:
+        """
+        searches the root in a narrow window around the value of the previous iteration, and widens
+        the window on the side that failed until the value falls inside it.
+        """
+        delta = MiniMaxSearch.ASPIRATION_WINDOW
+        alpha, beta = guess - delta, guess + delta
+        while True:
+            best_action, best_value = self._search_root(side, possible_actions, depth, alpha, beta)
+            if best_value <= alpha:
+                alpha = best_value - delta if delta < MiniMaxSearch.ASPIRATION_LIMIT else -INF
+            elif best_value >= beta:
+                beta = best_value + delta if delta < MiniMaxSearch.ASPIRATION_LIMIT else INF
+                # the move that failed high is likely the best one
+                possible_actions = [best_action] + [action for action in possible_actions
+                                                    if action != best_action]
+            else:
+                return best_action, best_value
+            delta *= 4
+
+    def _action_value(self, action: Action, side: Side, depth: int, alpha: float, beta: float) -> float:
+        if action == Action.SWAP:
+            return self._swap_value(side, depth, alpha, beta)
+        return self._move_value(action.value, side, depth, alpha, beta, 0)
+
+    def _swap_value(self, side: Side, depth: int, alpha: float, beta: float) -> float:
+        """
+        after a swap the agent plays the other side, and the opponent moves next from our old side.
+        """
+        if depth <= 1:
+            return 0.0
+        return -self._negamax(side, depth - 1, -beta, -alpha, 0)
+
+    def _move_value(self, hole: int, side: Side, depth: int, alpha: float, beta: float, ply: int) -> float:
+        """
+        :return: the value of the move, from the perspective of the side that makes it.
+        """
+        cells = self.cells
+        record = make_move(cells, hole, side, self.records[ply])
+        self.nodes += 1
+        if not self.nodes & MiniMaxSearch.CLOCK_MASK and self._out_of_time():
+            raise SearchTimeout
+        if self.tablebase is not None \
+                and cells[PackedBoard.NORTH_OFFSET] + cells[PackedBoard.SOUTH_OFFSET] >= self.tablebase_seeds:
+            value = self._tablebase_value(record)
+        elif depth <= 1 or record.game_over:
+            value = evaluate_cells(cells, record.seeds_added_to_store, record.captured,
+                                   record.extra_turn, side, hole)
+            if not record.game_over:
+                self.horizon_reached = True
+                if self.quiescence_nodes:
+                    self.quiescence_budget = self.quiescence_nodes
+                    if record.next_side is side:
+                        value = self._quiesce(side, value, alpha, beta, ply + 1)
+                    else:
+                        value = -self._quiesce(record.next_side, -value, -beta, -alpha, ply + 1)
+        elif record.next_side is side:
+            # an extra turn: the same side moves again, so the same window
+            value = self._negamax(side, depth - 1, alpha, beta, ply + 1)
+        else:
+            value = -self._negamax(record.next_side, depth - 1, -beta, -alpha, ply + 1)
+        unmake_move(cells, record)
+        return value
+
+    def _tablebase_value(self, record: MoveRecord) -> float:
+        """
+        :return: the exact value of the move just made, from the perspective of the side that made it.
+        """
+        cells = self.cells
+        offset = side_offset(record.side)
+        lead = cells[offset] - cells[PackedBoard.SOUTH_OFFSET - offset]
+        if not record.game_over:
+            remaining = self.tablebase.value(cells, record.next_side)
+            lead += remaining if record.next_side is record.side else -remaining
+        return exact_value(lead)
+
+    def _quiesce(self, side: Side, stand_pat: float, alpha: float, beta: float, ply: int) -> float:
+        """
+        searches the captures and extra turns of the side to move, beyond the horizon.
+        :param stand_pat: the value of the position for the side to move, if it stops here.
+        :return: the value of the position for the side to move (fail soft).
+        """
+        if stand_pat >= beta or self.quiescence_budget <= 0 or ply >= MiniMaxSearch.MAX_PLY - 1:
+            return stand_pat
+        cells = self.cells
+        offset = side_offset(side)
+        moves = sorted(((tactical_score(cells, hole, offset), hole) for hole in HOLES if cells[offset + hole]),
+                       reverse=True)
+        best = stand_pat
+        if best > alpha:
+            alpha = best
+        for score, hole in moves:
+            if not score or self.quiescence_budget <= 0:
+                break  # the rest are quiet moves
+            self.quiescence_budget -= 1
+            record = make_move(cells, hole, side, self.records[ply])
+            self.nodes += 1
+            if not self.nodes & MiniMaxSearch.CLOCK_MASK and self._out_of_time():
+                raise SearchTimeout
+            value = evaluate_cells(cells, record.seeds_added_to_store, record.captured,
+                                   record.extra_turn, side, hole)
+            if not record.game_over:
+                if record.next_side is side:
+                    value = self._quiesce(side, value, alpha, beta, ply + 1)
+                else:
+                    value = -self._quiesce(record.next_side, -value, -beta, -alpha, ply + 1)
+            unmake_move(cells, record)
+            if value > best:
+                best = value
+                if best > alpha:
+                    alpha = best
+                    if alpha >= beta:
+                        break
+        return best
+
+    def _negamax(self, side: Side, depth: int, alpha: float, beta: float, ply: int) -> float:
+        """
+        :return: the value of the position for the side to move (fail soft).
+        """
+        cells = self.cells
+        tt = self.tt
+        key = zobrist_key(cells, side)
+        entry = tt.probe(key)
+        tt_move = 0
+        if entry is not None:
+            tt_move = entry[4]
+            if entry[1] >= depth:
+                value, flag = entry[3], entry[2]
+                if flag == TranspositionTable.EXACT \
+                        or (flag == TranspositionTable.LOWER and value >= beta) \
+                        or (flag == TranspositionTable.UPPER and value <= alpha):
+                    # can't tell whether the stored subtree reached the horizon; assume it did
+                    self.horizon_reached = True
+                    return value
+        alpha_orig = alpha
+        offset = side_offset(side)
+        moves = self._ordered_moves(side, tt_move, ply) if self.move_ordering else MOVE_ORDERS[tt_move]
+        best, best_move = -INF, 0
+        for hole in moves:
+            if not cells[offset + hole]:
+                continue
+            if not best_move:
+                value = self._move_value(hole, side, depth, alpha, beta, ply)
+            else:
+                # prove that the move is no better than the best so far, with a null window.
+                # search it properly only if that fails
+                value = self._move_value(hole, side, depth, alpha, alpha + NULL_WINDOW, ply)
+                if alpha < value < beta:
+                    value = self._move_value(hole, side, depth, alpha, beta, ply)
+            if value > best:
+                best, best_move = value, hole
+                if best > alpha:
+                    alpha = best
+                    if alpha >= beta:
+                        if self.move_ordering:
+                            self._cutoff(side, hole, depth, ply)
+                        break
+        if best <= alpha_orig:
+            flag = TranspositionTable.UPPER
+        elif best >= beta:
+            flag = TranspositionTable.LOWER
+        else:
+            flag = TranspositionTable.EXACT
+        tt.store(key, depth, flag, best, best_move)
+        return best
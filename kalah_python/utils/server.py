@@ -1,95 +1,113 @@
 import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from kalah_python.utils.agents import Agent
+from kalah_python.utils.clock import TimeManager
 from enum import Enum, auto
 import logging
-from sys import stdout
+import multiprocessing
+import os
+from sys import stderr, stdin, stdout
+from typing import Callable, Optional, Set
 
 from kalah_python.utils.enums import AgentState
 
 logging.basicConfig(stream=stdout, level=logging.INFO)
-# suppress logs from transitions
-transitions_logger = logging.getLogger("transitions.core")
-transitions_logger.setLevel(logging.INFO)
 
 
-class Server:
-    class MsgType(Enum):
-        START = auto()
-        CHANGE = auto()
-        END = auto()
+class Session:
+    """
+    one match, on one connection. The session has an agent (and so a board) of its own,
+    so matches on other connections can't touch it.
+    """
 
-    def __init__(self, agent: Agent, listen_forever: bool):
+    def __init__(self, agent: Agent, ponder: bool = False, decision_timeout: Optional[float] = None):
         self.agent: Agent = agent
-        print("---------listen_forever:" + str(listen_forever))
-        self.listen_forever = listen_forever
-
-    @staticmethod
-    def get_msg_type(msg: str) -> MsgType:
-        logger = logging.getLogger("get_msg_type")
-        logger.info(msg)
-        if msg.startswith("START;"):
-            return Server.MsgType.START
-        if msg.startswith("CHANGE;"):
-            return Server.MsgType.CHANGE
-        elif msg == "END":
-            return Server.MsgType.END
-        else:
-            raise ValueError("Invalid msg:" + msg)
-
-    def start_hosting(self, host: str, port: int):
-        logger = logging.getLogger("run")
-        loop = asyncio.get_event_loop()
-        # create task to the
-        loop.create_task(asyncio.start_server(self._handle_client, host, port))
-        logger.info("running the server...")
-        # exception handling
-        loop.set_exception_handler(self.handle_exception)
-        loop.run_forever()
-
-    def handle_exception(self, loop, context):
-        print(context['exception'])
-        if self.listen_forever:
-            print("listening forever")
-            self.reset_states()
-        else:
-            print("stop listening")
-            loop.stop()  # stop the loop on any exception.
+        # decisions run on a worker thread, so that the event loop stays responsive while the agent thinks.
+        # (a thread rather than a process: the agent keeps state between moves, e.g. its transposition table)
+        self.agent.defer_decisions = True
+        # a thread of its own: a match never has more than one decision running, and never waits for another's
+        self.executor: ThreadPoolExecutor = ThreadPoolExecutor(max_workers=1)
+        self.ponder: bool = ponder
+        self.decision_timeout: Optional[float] = decision_timeout
+        self.opp_to_move: bool = False  # the last game state was OPP
 
-    async def _handle_client(self, reader, writer):
+    async def play(self, reader, writer):
         """
         code reference: https://stackoverflow.com/a/48507121
+        reads one message (line) at a time, so messages split over reads, or several
+        messages in one read, are handled in the order they were sent.
         :param reader:
         :param writer:
         :return:
         """
         logger = logging.getLogger("_handle_client")
         msg = None
-        while msg != "END":  # while msg is not empty string
-            msg = (await reader.read(255)).decode('utf8').strip()
-            if not msg:
-                raise ConnectionResetError
+        next_read: Optional[asyncio.Future] = None
+        while msg != "END":
+            msg = await (next_read or Session.read_msg(reader))
+            next_read = None
             logger.info(msg)
-            for msg_split in msg.split("\n"):
-                if msg_split:
-                    self._interpret_msg(msg.strip())
+            # whatever the message is, the opponent is done thinking
+            self.agent.stop_pondering()
+            self._interpret_msg(msg)
+            if self.agent.decision_pending:
+                # keep reading while the agent thinks. anything arriving now (END after a timeout,
+                # or the connection dropping) means the game was aborted.
+                next_read = asyncio.ensure_future(Session.read_msg(reader))
+                await self._decide(interrupt=next_read)
             if self.agent.action_is_registered():  # check if an action is registered.
-                try:
-                    # make a move on the server side.
-                    # this will fail if the connection is lost
-                    writer.write(self.agent.action.to_cmd())
-                except ConnectionResetError as cre:
-                    raise cre
-                else:
-                    # if the command was successful, commit and unregister the action
-                    # commit the action
-                    self.agent.commit_action()
-                    self.agent.unregister_action()
-                    # clear the buffer
-                    await writer.drain()
+                # make a move on the server side. write() only buffers it; the transport sends it
+                # as soon as it can, and drain() waits only if the peer is not keeping up.
+                writer.write(self.agent.action.to_cmd())
+                # commit and unregister the action
+                self.agent.commit_action()
+                self.agent.unregister_action()
+                await writer.drain()
+            if self.ponder and self.opp_to_move and self.agent.state == AgentState.WAIT_FOR_GAME_STATE:
+                self.agent.start_pondering()
         writer.close()
 
+    @staticmethod
+    async def read_msg(reader: asyncio.StreamReader) -> str:
+        """
+        :return: the next non-empty line, without the line break.
+        """
+        while True:
+            try:
+                line = await reader.readuntil(b"\n")
+            except asyncio.IncompleteReadError:
+                # the connection was closed (possibly in the middle of a message)
+                raise ConnectionResetError
+            except asyncio.LimitOverrunError:
+                raise ValueError("msg too long")
+            msg = line.decode('utf8').strip()
+            if msg:
+                return msg
+
+    async def _decide(self, interrupt: asyncio.Future):
+        """
+        runs the pending decision of the agent in the executor, and registers the action.
+        The decision is cancelled when the interrupt completes first, or when the decision_timeout hits.
+        :param interrupt: the read that is waiting for the next message.
+        """
+        logger = logging.getLogger("_decide")
+        self.agent.decision_pending = False
+        self.agent.cancel_event.clear()
+        decision = asyncio.get_event_loop().run_in_executor(self.executor, self.agent.timed_decision)
+        done, _ = await asyncio.wait({decision, interrupt}, timeout=self.decision_timeout,
+                                     return_when=asyncio.FIRST_COMPLETED)
+        if decision not in done:
+            logger.info("cancelling the decision")
+            self.agent.cancel_decision()
+        action = await decision
+        if interrupt.done():
+            # the game was aborted while thinking. the next message will tell how.
+            logger.info("interrupted while deciding")
+            return
+        self.agent.register_action(action)
+
     def _interpret_msg(self, msg: str):
-        msg_type = self.get_msg_type(msg)
+        msg_type = Server.get_msg_type(msg)
         if msg_type == Server.MsgType.START:
             self._interpret_start_msg(start_msg=msg)
         elif msg_type == Server.MsgType.CHANGE:
@@ -133,6 +151,7 @@ class Server:
         self.agent.board.update_board(change_msg)
         game_state = change_msg.strip().split(";")[-1]
         logger.info(game_state)
+        self.opp_to_move = game_state == "OPP"
         if self.agent.state == AgentState.WAIT_FOR_SWAP_DECISION:
             if change_msg.strip().split(";")[1] == "SWAP":
                 self.agent.opp_swap()
@@ -144,17 +163,185 @@ class Server:
                 self.agent.game_state_is_you()
             elif game_state == "OPP":
                 self.agent.game_state_is_opp()
-            elif game_state in ("END\nEND" or "END"):  # non-deterministic
+            elif game_state == "END":
                 self.agent.game_state_is_end()
             else:
                 raise ValueError("invalid game_state:" + game_state)
 
     def _interpret_end_msg(self):
+        self.agent.stop_pondering()
         print("------game is finished--------")
+        if self.agent.time_manager:
+            print("clock:", self.agent.time_manager)
         print("your score:", self.agent.board.store(self.agent.side))
         print("opponent's score:", self.agent.board.store(self.agent.side.opposite()))
         raise ConnectionResetError
 
-    def reset_states(self):
+    def close(self):
+        """
+        stops whatever the agent is still doing, and gets it ready for the next match.
+        """
+        self.agent.cancel_decision()
+        self.agent.stop_pondering()
+        self.executor.shutdown(wait=False)
+        self.opp_to_move = False
         self.agent.reset()
         self.agent.board.reset()
+
+
+class Server:
+    class MsgType(Enum):
+        START = auto()
+        CHANGE = auto()
+        END = auto()
+
+    def __init__(self, agent_factory: Callable[[], Agent], listen_forever: bool,
+                 time_manager_factory: Optional[Callable[[], TimeManager]] = None,
+                 ponder: bool = False, decision_timeout: Optional[float] = None, pool_size: int = 0):
+        """
+        :param agent_factory: makes the agent of a session. Every connection gets an agent of its own.
+        :param listen_forever: keep serving matches. Otherwise the server stops when its first match ends.
+        :param time_manager_factory: if given, the agents' decisions are timed against a game clock
+        made by this, and agents that search by time get their per-move budget from it.
+        :param ponder: let the agents think while their opponents are thinking (REQ5).
+        :param decision_timeout: seconds after which a decision is cancelled, and the agent
+        has to go with the best action it has found so far.
+        :param pool_size: if positive, this many agents are made up front and reused from match to match.
+        This also bounds the matches served at once (per worker); further connections wait for a free agent.
+        Otherwise, a fresh agent is made for every connection.
+        """
+        self.agent_factory: Callable[[], Agent] = agent_factory
+        self.time_manager_factory: Optional[Callable[[], TimeManager]] = time_manager_factory
+        self.ponder: bool = ponder
+        self.decision_timeout: Optional[float] = decision_timeout
+        self.pool_size: int = pool_size
+        # made in the process that serves, once its loop is running
+        self.pool: Optional[asyncio.Queue] = None
+        self.sessions: Set[Session] = set()
+        self.listen_forever = listen_forever
+
+    @staticmethod
+    def get_msg_type(msg: str) -> MsgType:
+        logger = logging.getLogger("get_msg_type")
+        logger.info(msg)
+        if msg.startswith("START;"):
+            return Server.MsgType.START
+        if msg.startswith("CHANGE;"):
+            return Server.MsgType.CHANGE
+        elif msg == "END":
+            return Server.MsgType.END
+        else:
+            raise ValueError("Invalid msg:" + msg)
+
+    def new_agent(self) -> Agent:
+        agent = self.agent_factory()
+        if self.time_manager_factory:
+            agent.time_manager = self.time_manager_factory()
+        return agent
+
+    def start_hosting(self, host: str, port: int, workers: int = 1):
+        """
+        :param workers: the number of processes to serve from. They all listen on the same port
+        (SO_REUSEPORT), and the kernel spreads the connections over them. Every process makes a server of its
+        own from the settings of this one, so with the spawn start method the factories must pickle
+        (e.g. partials of module-level functions).
+        """
+        print("---------listen_forever:" + str(self.listen_forever))
+        if workers <= 1:
+            self._host(host, port, reuse_port=False)
+            return
+        settings = (self.agent_factory, self.listen_forever, self.time_manager_factory, self.ponder,
+                    self.decision_timeout, self.pool_size)
+        processes = [
+            multiprocessing.Process(target=_host_worker, args=(settings, host, port), daemon=True)
+            for _ in range(workers)
+        ]
+        for process in processes:
+            process.start()
+        try:
+            for process in processes:
+                process.join()
+        except KeyboardInterrupt:
+            for process in processes:
+                process.terminate()
+
+    def start_stdio(self):
+        """
+        plays one match over stdin and stdout, for engines that launch the agent themselves (REQ3b), e.g.
+        java -jar ManKalah.jar "java -jar MKRefAgent.jar" "python3 -m kalah_python.host_g25_agent --stdio"
+        stdout then carries the protocol only: anything else printed or logged goes to stderr.
+        """
+        logger = logging.getLogger("run")
+        stdout.flush()
+        protocol_fd = os.dup(stdout.fileno())
+        os.dup2(stderr.fileno(), stdout.fileno())
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        logger.info("playing over stdio...")
+        try:
+            loop.run_until_complete(self._serve_stdio(protocol_fd))
+        except ConnectionResetError:
+            print("------match over--------")
+        finally:
+            loop.close()
+
+    async def _serve_stdio(self, protocol_fd: int):
+        loop = asyncio.get_running_loop()
+        # non-blocking pipes: the engine's messages are handled as soon as a line is in,
+        # and a move is handed to the OS as soon as it is written (no buffering on our side)
+        reader = asyncio.StreamReader()
+        await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), stdin)
+        transport, protocol = await loop.connect_write_pipe(asyncio.streams.FlowControlMixin,
+                                                            os.fdopen(protocol_fd, 'wb', buffering=0))
+        writer = asyncio.StreamWriter(transport, protocol, reader, loop)
+        await self._handle_client(reader, writer)
+
+    def _host(self, host: str, port: int, reuse_port: bool):
+        logger = logging.getLogger("run")
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        loop.run_until_complete(self._serve(host, port, reuse_port))
+        logger.info("running the server...")
+        # exception handling
+        loop.set_exception_handler(self.handle_exception)
+        loop.run_forever()
+
+    async def _serve(self, host: str, port: int, reuse_port: bool):
+        if self.pool_size > 0:
+            self.pool = asyncio.Queue(maxsize=self.pool_size)
+            for _ in range(self.pool_size):
+                self.pool.put_nowait(self.new_agent())
+        await asyncio.start_server(self._handle_client, host, port, reuse_port=reuse_port or None)
+
+    def handle_exception(self, loop, context):
+        print(context.get('exception', context['message']))
+        if self.listen_forever:
+            print("listening forever")
+        else:
+            print("stop listening")
+            loop.stop()  # stop the loop on any exception.
+
+    async def _handle_client(self, reader, writer):
+        logger = logging.getLogger("_handle_client")
+        agent = await self.pool.get() if self.pool is not None else self.new_agent()
+        session = Session(agent, ponder=self.ponder, decision_timeout=self.decision_timeout)
+        self.sessions.add(session)
+        logger.info("session opened: {} ({} live)".format(writer.get_extra_info('peername'), len(self.sessions)))
+        try:
+            await session.play(reader, writer)
+        finally:
+            # ends the match, however it ended. (exceptions still reach handle_exception)
+            session.close()
+            self.sessions.discard(session)
+            if self.pool is not None:
+                self.pool.put_nowait(agent)
+            logger.info("session closed: {} ({} live)".format(writer.get_extra_info('peername'),
+                                                              len(self.sessions)))
+
+
+def _host_worker(settings: tuple, host: str, port: int):
+    """
+    the target of a worker process of Server.start_hosting: serves on the port, along with the other workers.
+    :param settings: the arguments of Server.__init__.
+    """
+    Server(*settings)._host(host, port, reuse_port=True)
@@ -0,0 +1,160 @@
+"""
+A sequential probability ratio test of a candidate agent against a baseline:
+play colour-balanced pairs of games until the games are enough to accept
+H1 (the candidate is at least elo1 stronger) or H0 (it is at most elo0 stronger).
+Clear cases stop after few games; only close ones need many.
+"""
+from typing import Callable, Iterator, Optional
+import itertools
+import json
+import math
+import multiprocessing
+import os
+import random
+
+from kalah_python.utils.tournament import play_game, random_opening
+
+
+class SPRT:
+    """
+    the generalized SPRT of the score per game (a trinomial: win, draw, loss),
+    with the normal approximation of its log-likelihood ratio:
+    LLR = N * (s1 - s0) * (2 * mean - s0 - s1) / (2 * variance)
+    where s0, s1 are the expected scores of elo0, elo1.
+    """
+    H0 = "H0"
+    H1 = "H1"
+
+    def __init__(self, elo0: float = 0.0, elo1: float = 20.0, alpha: float = 0.05, beta: float = 0.05):
+        """
+        :param elo0: the elo difference of H0
+        :param elo1: the elo difference of H1 (> elo0)
+        :param alpha: the false positive rate (accepting H1 when H0 holds)
+        :param beta: the false negative rate (accepting H0 when H1 holds)
+        """
+        if elo1 <= elo0:
+            raise ValueError("elo1 should be greater than elo0")
+        self.elo0, self.elo1 = elo0, elo1
+        self.lower: float = math.log(beta / (1 - alpha))
+        self.upper: float = math.log((1 - beta) / alpha)
+        self.wins: int = 0
+        self.draws: int = 0
+        self.losses: int = 0
+
+    @staticmethod
+    def expected_score(elo: float) -> float:
+        return 1.0 / (1.0 + 10.0 ** (-elo / 400.0))
+
+    @property
+    def games(self) -> int:
+        return self.wins + self.draws + self.losses
+
+    def add(self, points: float):
+        """
+        :param points: the candidate's points of a game: 1, 0.5 or 0.
+        """
+        if points == 1.0:
+            self.wins += 1
+        elif points == 0.5:
+            self.draws += 1
+        elif points == 0.0:
+            self.losses += 1
+        else:
+            raise ValueError("invalid points:" + str(points))
+
+    def mean(self) -> float:
+        return (self.wins + 0.5 * self.draws) / self.games
+
+    def llr(self) -> float:
+        games = self.games
+        if not games:
+            return 0.0
+        mean = self.mean()
+        variance = (self.wins * (1.0 - mean) ** 2 + self.draws * (0.5 - mean) ** 2
+                    + self.losses * mean ** 2) / games
+        if variance == 0.0:
+            # all the games had the same result so far; count one draw more, or the ratio has no bound
+            mean = (self.wins + 0.5 * (self.draws + 1)) / (games + 1)
+            variance = (self.wins * (1.0 - mean) ** 2 + (self.draws + 1) * (0.5 - mean) ** 2
+                        + self.losses * mean ** 2) / (games + 1)
+        s0, s1 = SPRT.expected_score(self.elo0), SPRT.expected_score(self.elo1)
+        return games * (s1 - s0) * (2.0 * mean - s0 - s1) / (2.0 * variance)
+
+    def status(self) -> Optional[str]:
+        """
+        :return: H0 or H1 once accepted. None while undecided.
+        """
+        llr = self.llr()
+        if llr >= self.upper:
+            return SPRT.H1
+        if llr <= self.lower:
+            return SPRT.H0
+        return None
+
+    def elo(self) -> float:
+        """
+        :return: the elo difference estimated from the games so far.
+        """
+        mean = min(max(self.mean(), 1e-6), 1.0 - 1e-6)
+        return -400.0 * math.log10(1.0 / mean - 1.0)
+
+    def __str__(self) -> str:
+        return "games={} W/D/L={}/{}/{} elo={:.1f} llr={:.2f} [{:.2f}, {:.2f}]".format(
+            self.games, self.wins, self.draws, self.losses,
+            self.elo() if self.games else 0.0, self.llr(), self.lower, self.upper
+        )
+
+
+def game_pairs(candidate: str, baseline: str, opening_plies: int, seed: int) -> Iterator[dict]:
+    """
+    pairs of games on the same random opening, with the candidate moving 1st in one, and 2nd in the other.
+    """
+    rng = random.Random(seed)
+    game = 0
+    while True:
+        opening = random_opening(opening_plies, rng)
+        game_seed = rng.getrandbits(32)
+        for first, second in ((candidate, baseline), (baseline, candidate)):
+            yield {'game': game, 'first': first, 'second': second, 'opening': opening, 'seed': game_seed}
+            game += 1
+
+
+def run_sprt(candidate: str, baseline: str, sprt: SPRT, max_games: int = 10000,
+             processes: Optional[int] = None, opening_plies: int = 1, seed: int = 0,
+             out_path: Optional[str] = None, on_result: Optional[Callable[[dict], None]] = None) -> Optional[str]:
+    """
+    plays games over a pool of processes until the test decides, or max_games are played.
+    The test is updated after every game, and the games still running when it decides are dropped.
+    :param out_path: if given, every result is appended to it (one JSON object per line).
+    :param on_result: called with every result.
+    :return: the accepted hypothesis, or None if max_games were not enough.
+    """
+    if candidate == baseline:
+        raise ValueError("the candidate and the baseline should be different agents:" + candidate)
+    processes = processes or os.cpu_count()
+    games = game_pairs(candidate, baseline, opening_plies, seed)
+    out = None
+    if out_path:
+        out_dir = os.path.dirname(out_path)
+        if out_dir:
+            os.makedirs(out_dir, exist_ok=True)
+        out = open(out_path, 'a')
+    # the pool takes games from the stream as its workers free up. terminate() drops the rest, the running
+    # ones included. (ProcessPoolExecutor can't drop them before python 3.9, and may hang on exit without)
+    pool = multiprocessing.Pool(processes)
+    try:
+        for result in pool.imap_unordered(play_game, itertools.islice(games, max_games), chunksize=1):
+            sprt.add(result['result'] if result['first'] == candidate else 1.0 - result['result'])
+            if out:
+                out.write(json.dumps(result) + "\n")
+                out.flush()
+            if on_result:
+                on_result(result)
+            status = sprt.status()
+            if status:
+                return status
+        return None
+    finally:
+        pool.terminate()
+        if out:
+            out.close()
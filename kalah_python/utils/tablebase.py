@@ -0,0 +1,244 @@
+"""
+Endgame tablebases: the exact value of every position with at most max_seeds seeds left in the holes.
+The stores don't matter for how the rest of the game goes, so a position is the 14 holes and the side
+to move. Its value is what the side to move will add to its store from now on, minus what the
+opponent will add, with perfect play from both sides. Seen from the side to move, the two sides play
+the same game, so only the positions with the side to move first are kept: its 7 holes, then the
+opponent's 7 holes.
+
+The positions with n seeds in the holes (a level) are the compositions of n into 14 parts, indexed
+by the combinatorial number system (the parts are stars, with 13 bars between them). A level only
+depends on itself and the levels below it: a move that adds no seed to a store only moves seeds towards
+the mover's store, so the positions of a level form no cycles, and value iteration over the level
+ends.
+
+The file is a header (magic, max_seeds), then the levels 0 to max_seeds back to back, one signed
+byte per position.
+"""
+from multiprocessing import Pool
+from typing import List, Optional, Tuple
+import mmap
+import os
+import struct
+import time
+
+import numpy as np
+
+from kalah_python.utils.batch_env import BatchKalahEnv, SOUTH
+from kalah_python.utils.board import Board, PackedBoard
+from kalah_python.utils.engine import side_offset
+from kalah_python.utils.enums import Side
+
+HOLES = Board.HOLES_PER_SIDE
+PARTS = 2 * HOLES
+MAGIC = b"KTB1"
+HEADER = struct.Struct("<4sH2x")
+# values are signed bytes
+MAX_SEEDS_LIMIT = 127
+# BINOM[n][k] = n choose k, for the ranks of the compositions
+BINOM: List[List[int]] = [[0] * (PARTS + 1) for _ in range(MAX_SEEDS_LIMIT + PARTS + 1)]
+for _n in range(len(BINOM)):
+    BINOM[_n][0] = 1
+    for _k in range(1, min(_n, PARTS) + 1):
+        BINOM[_n][_k] = BINOM[_n - 1][_k - 1] + BINOM[_n - 1][_k]
+# the generator works on whole levels in memory (and indexes the table with int32).
+# level 16 has 68M positions, already more than that allows
+NP_MAX_SEEDS = 16
+NP_BINOM: np.ndarray = np.array([row for row in BINOM[:NP_MAX_SEEDS + PARTS]], dtype=np.int64)
+
+
+def level_size(seeds: int) -> int:
+    """
+    :return: the number of positions with the given seeds in the holes.
+    """
+    return BINOM[seeds + PARTS - 1][PARTS - 1]
+
+
+def level_offsets(max_seeds: int) -> List[int]:
+    """
+    :return: where every level starts (after the header), and where the last one ends.
+    """
+    offsets = [0]
+    for seeds in range(max_seeds + 1):
+        offsets.append(offsets[-1] + level_size(seeds))
+    return offsets
+
+
+def rank(parts: List[int]) -> int:
+    """
+    :return: the index of the 14 holes within their level.
+    """
+    index = 0
+    prefix = 0
+    for k in range(PARTS - 1):
+        prefix += parts[k]
+        index += BINOM[prefix + k][k + 1]
+    return index
+
+
+def rank_array(parts: np.ndarray) -> np.ndarray:
+    """
+    rank, for the rows of an (N, 14) array.
+    """
+    prefix = np.cumsum(parts[:, :PARTS - 1], axis=1)
+    return NP_BINOM[prefix + np.arange(PARTS - 1), np.arange(1, PARTS)].sum(axis=1)
+
+
+def unrank_array(seeds: int, ranks: np.ndarray) -> np.ndarray:
+    """
+    :return: (N, 14) the holes of the given ranks of a level.
+    """
+    remainder = ranks.astype(np.int64)
+    prefix = np.empty((ranks.size, PARTS - 1), dtype=np.int64)
+    for k in range(PARTS - 1, 0, -1):
+        # the largest bar position b with (b choose k) <= remainder
+        column = NP_BINOM[:, k]
+        bar = np.searchsorted(column, remainder, side='right') - 1
+        remainder -= column[bar]
+        prefix[:, k - 1] = bar - (k - 1)
+    parts = np.empty((ranks.size, PARTS), dtype=np.int32)
+    parts[:, 0] = prefix[:, 0]
+    parts[:, 1:PARTS - 1] = np.diff(prefix, axis=1)
+    parts[:, PARTS - 1] = seeds - prefix[:, -1]
+    return parts
+
+
+def _children(task: Tuple[int, int, int, List[int]]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    makes every move of a chunk of a level.
+    :param task: the seeds of the level, the chunk (start, end) of its ranks, and the level offsets.
+    :return: (N, 7) arrays: where every move leads (the index of the position in the table, -1 if the game
+    is over or the move is illegal), the stores lead it adds for the mover, and +1 if the mover moves again
+    (-1 if the opponent does, 0 if the move is illegal).
+    """
+    seeds, start, end, offsets = task
+    parts = unrank_array(seeds, np.arange(start, end, dtype=np.int64))
+    size = end - start
+    child = np.full((size, HOLES), -1, dtype=np.int32)
+    lead = np.zeros((size, HOLES), dtype=np.int16)
+    sign = np.zeros((size, HOLES), dtype=np.int8)
+    # the side to move plays south
+    cells = np.zeros((size, PackedBoard.CELLS), dtype=np.int32)
+    cells[:, PackedBoard.SOUTH_OFFSET + 1:] = parts[:, :HOLES]
+    cells[:, PackedBoard.NORTH_OFFSET + 1:PackedBoard.NORTH_OFFSET + HOLES + 1] = parts[:, HOLES:]
+    for hole in range(1, HOLES + 1):
+        rows = np.nonzero(parts[:, hole - 1])[0]
+        if not rows.size:
+            continue
+        env = BatchKalahEnv(rows.size)
+        env.reset(cells[rows])
+        env.moves[:] = 2  # past the pie rule
+        after, _, done = env.step(np.full(rows.size, hole))
+        lead[rows, hole - 1] = after[:, PackedBoard.SOUTH_OFFSET] - after[:, PackedBoard.NORTH_OFFSET]
+        again = env.side == SOUTH
+        sign[rows, hole - 1] = np.where(again, 1, -1)
+        south = after[:, PackedBoard.SOUTH_OFFSET + 1:]
+        north = after[:, PackedBoard.NORTH_OFFSET + 1:PackedBoard.NORTH_OFFSET + HOLES + 1]
+        # the side to move of the child first
+        child_parts = np.where(again[:, None], np.hstack((south, north)), np.hstack((north, south)))
+        left = child_parts.sum(axis=1)
+        index = np.asarray(offsets)[left] + rank_array(child_parts)
+        child[rows, hole - 1] = np.where(done, -1, index)
+    return child, lead, sign
+
+
+def _solve_level(table: np.ndarray, seeds: int, offsets: List[int], pool: Optional[Pool], chunk: int):
+    """
+    fills in the level of the given seeds. The levels below must be done.
+    """
+    start, end = offsets[seeds], offsets[seeds + 1]
+    tasks = [(seeds, idx, min(idx + chunk, end - start), offsets) for idx in range(0, end - start, chunk)]
+    results = pool.map(_children, tasks) if pool is not None else [_children(task) for task in tasks]
+    child = np.concatenate([result[0] for result in results])
+    lead = np.concatenate([result[1] for result in results])
+    sign = np.concatenate([result[2] for result in results])
+    legal = sign != 0
+    same_level = (child >= start) & (child < end)
+    # the moves to the levels below (or to the end of the game) are known already
+    known = np.where(child >= 0, lead + sign * table[np.maximum(child, 0)], lead)
+    base = np.where(legal & ~same_level, known, np.iinfo(np.int32).min).max(axis=1)
+    # the side to move has no seeds: the game is over, and the opponent collects them all
+    base[~legal.any(axis=1)] = -seeds
+    same_rows = np.nonzero(same_level.any(axis=1))[0]
+    same_mask = same_level[same_rows]
+    same_child = np.where(same_mask, child[same_rows] - start, 0)
+    same_lead = lead[same_rows]
+    same_sign = sign[same_rows]
+    values = base.copy()
+    # value iteration: the level has no cycles, so this ends after as many sweeps as its longest chain
+    while True:
+        moves = np.where(same_mask, same_lead + same_sign * values[same_child], np.iinfo(np.int32).min)
+        updated = np.maximum(base[same_rows], moves.max(axis=1))
+        if np.array_equal(updated, values[same_rows]):
+            break
+        values[same_rows] = updated
+    table[start:end] = values
+
+
+def build_tablebase(max_seeds: int, path: str, processes: Optional[int] = None, chunk: int = 1 << 15,
+                    verbose: bool = True) -> np.ndarray:
+    """
+    solves the levels 0 to max_seeds, one after the other, and writes the tablebase to path.
+    The moves of every level are made over a pool of processes.
+    :return: the table.
+    """
+    if not 0 <= max_seeds <= NP_MAX_SEEDS:
+        raise ValueError("max_seeds must be between 0 and {}".format(NP_MAX_SEEDS))
+    offsets = level_offsets(max_seeds)
+    table = np.zeros(offsets[-1], dtype=np.int32)
+    processes = processes or os.cpu_count()
+    pool = Pool(processes) if processes > 1 else None
+    try:
+        for seeds in range(max_seeds + 1):
+            start = time.perf_counter()
+            _solve_level(table, seeds, offsets, pool, chunk)
+            if verbose:
+                print("seeds={:<3} positions={:<10} {:.1f}s".format(seeds, level_size(seeds),
+                                                                     time.perf_counter() - start))
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    out_dir = os.path.dirname(path)
+    if out_dir:
+        os.makedirs(out_dir, exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, max_seeds))
+        f.write(table.astype(np.int8).tobytes())
+    return table
+
+
+class Tablebase:
+    """
+    a tablebase file, memory-mapped: opening it reads only the header, and the pages are shared
+    by every process that maps the file.
+    """
+
+    def __init__(self, path: str):
+        self.path = path  # for other processes to map it too
+        with open(path, 'rb') as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.max_seeds = HEADER.unpack_from(self.mm, 0)
+        if magic != MAGIC:
+            raise ValueError("not a tablebase: " + path)
+        self.offsets: List[int] = [HEADER.size + offset for offset in level_offsets(self.max_seeds)]
+        if len(self.mm) != self.offsets[-1]:
+            raise ValueError("truncated tablebase: " + path)
+
+    def covers(self, cells: List[int]) -> bool:
+        return sum(cells) - cells[PackedBoard.NORTH_OFFSET] - cells[PackedBoard.SOUTH_OFFSET] <= self.max_seeds
+
+    def value(self, cells: List[int], side: Side) -> int:
+        """
+        :param cells: 16 cells in the PackedBoard layout, with at most max_seeds in the holes.
+        :param side: the side to move
+        :return: the seeds the side to move will add to its store, minus those the opponent will add.
+        """
+        offset = side_offset(side)
+        opp_offset = PackedBoard.SOUTH_OFFSET - offset
+        parts = cells[offset + 1:offset + HOLES + 1] + cells[opp_offset + 1:opp_offset + HOLES + 1]
+        byte = self.mm[self.offsets[sum(parts)] + rank(parts)]
+        return byte - 256 if byte > 127 else byte
+
+    def close(self):
+        self.mm.close()
@@ -0,0 +1,238 @@
+"""
+Round-robin tournaments between registered agents. The games are played in-process
+(HeadlessKalahEnv) over a pool of worker processes, streamed to a JSON-lines file as they finish,
+and rated with Elo (with bootstrap confidence intervals).
+"""
+from functools import partial
+from typing import Callable, Dict, List, Optional, Tuple
+import itertools
+import json
+import multiprocessing
+import os
+import random
+import time
+
+import numpy as np
+
+from kalah_python.utils.agents import Agent, RandomAgent, MiniMaxAgent, MCTSAgent
+from kalah_python.utils.board import PackedBoard
+from kalah_python.utils.engine import make_move, legal_moves
+from kalah_python.utils.enums import SearchMode, Side
+from kalah_python.utils.env import HeadlessKalahEnv
+
+# name -> a factory of the agent. (workers make their agents by name, so the factories need not pickle)
+AGENTS: Dict[str, Callable[[], Agent]] = {
+    "random": partial(RandomAgent, verbose=False, buffer=False),
+    # one ply: the heuristic on its own
+    "greedy": partial(MiniMaxAgent, verbose=False, buffer=False, depth=1, quiescence_nodes=0),
+    "minimax_d2": partial(MiniMaxAgent, verbose=False, buffer=False, depth=2),
+    "minimax_d4": partial(MiniMaxAgent, verbose=False, buffer=False, depth=4),
+    "minimax_d6": partial(MiniMaxAgent, verbose=False, buffer=False, depth=6),
+    # without the quiescence search: a hard cut at the horizon
+    "minimax_d4_noq": partial(MiniMaxAgent, verbose=False, buffer=False, depth=4, quiescence_nodes=0),
+    "minimax_d6_noq": partial(MiniMaxAgent, verbose=False, buffer=False, depth=6, quiescence_nodes=0),
+    "minimax_legacy": partial(MiniMaxAgent, verbose=False, buffer=False, search_mode=SearchMode.LEGACY),
+    # playouts per move
+    "mcts_4k": partial(MCTSAgent, verbose=False, buffer=False, playouts=4096),
+    "mcts_16k": partial(MCTSAgent, verbose=False, buffer=False, playouts=16384),
+}
+# the agents of this (worker) process, by name and seat (0: 1st, 1: 2nd), made on first use and kept between games.
+# (one per seat, so that an agent never plays against itself)
+_agents: Dict[Tuple[str, int], Agent] = dict()
+
+
+def register_agent(name: str, factory: Callable[[], Agent]):
+    """
+    adds an agent to the registry. Register at import time (e.g. in the module of the agent),
+    so that the worker processes have it too.
+    """
+    if name in AGENTS:
+        raise ValueError("agent already registered:" + name)
+    AGENTS[name] = factory
+
+
+def random_opening(plies: int, rng: random.Random) -> List[int]:
+    """
+    :return: the holes of random moves from the initial board. (stops early if the game ends)
+    """
+    cells = list(PackedBoard.INIT_CELLS)
+    side = Side.SOUTH
+    opening = list()
+    for ply in range(plies):
+        hole = rng.choice(legal_moves(cells, side))
+        opening.append(hole)
+        record = make_move(cells, hole, side)
+        if record.game_over:
+            break
+        # (the 1st move never earns an extra turn: pie rule)
+        side = record.next_side if ply > 0 else side.opposite()
+    return opening
+
+
+def schedule(names: List[str], games_per_pair: int, opening_plies: int = 1, seed: int = 0) -> List[dict]:
+    """
+    every pair of agents plays games_per_pair games, taking turns to move 1st.
+    Each two games share a random opening, so that both agents play both sides of it
+    (and both sides of the swap decision, with an opening of 1 ply).
+    :return: the games to play
+    """
+    if len(set(names)) != len(names):
+        raise ValueError("every agent should be scheduled once:" + str(names))
+    rng = random.Random(seed)
+    games = list()
+    for name_a, name_b in itertools.combinations(names, 2):
+        for idx in range(games_per_pair):
+            if idx % 2 == 0:
+                opening = random_opening(opening_plies, rng)
+                game_seed = rng.getrandbits(32)
+            first, second = (name_a, name_b) if idx % 2 == 0 else (name_b, name_a)
+            games.append({'game': len(games), 'first': first, 'second': second,
+                          'opening': opening, 'seed': game_seed})
+    return games
+
+
+def _agent(name: str, seat: int) -> Agent:
+    agent = _agents.get((name, seat))
+    if agent is None:
+        agent = _agents[(name, seat)] = AGENTS[name]()
+    return agent
+
+
+def play_game(game: dict) -> dict:
+    """
+    plays one scheduled game (in whatever process this is).
+    :return: the game, with its result. result is the points of the 1st agent: 1, 0.5 or 0.
+    """
+    random.seed(game['seed'])
+    agent_1st, agent_2nd = _agent(game['first'], 0), _agent(game['second'], 1)
+    env = HeadlessKalahEnv(agent_1st, agent_2nd, check_invariants=False)
+    start = time.perf_counter()
+    game_res = env.play_game(opening=game['opening'])
+    score_1st = int(game_res.board.store(agent_1st.side))
+    score_2nd = int(game_res.board.store(agent_2nd.side))
+    result = dict(game)
+    result.update({
+        'swapped': bool(agent_1st.side == Side.NORTH),
+        'score_first': score_1st,
+        'score_second': score_2nd,
+        'result': 1.0 if score_1st > score_2nd else 0.0 if score_1st < score_2nd else 0.5,
+        'moves': env.moves,
+        'seconds': round(time.perf_counter() - start, 4)
+    })
+    return result
+
+
+def run_tournament(games: List[dict], out_path: str, processes: Optional[int] = None,
+                   on_result: Optional[Callable[[dict], None]] = None) -> List[dict]:
+    """
+    plays the games over a pool of processes, and appends every result to out_path
+    (one JSON object per line) as soon as it is in.
+    :param processes: defaults to one per core. 1 plays in this process.
+    :param on_result: called with every result, e.g. to show the progress.
+    :return: the results, in the order they finished.
+    """
+    results = list()
+    out_dir = os.path.dirname(out_path)
+    if out_dir:
+        os.makedirs(out_dir, exist_ok=True)
+    with open(out_path, 'a') as out:
+        if processes == 1:
+            result_iter = map(play_game, games)
+            pool = None
+        else:
+            pool = multiprocessing.Pool(processes)
+            # small chunks keep the stream going, and the slow pairings spread over the workers
+            result_iter = pool.imap_unordered(play_game, games, chunksize=1)
+        try:
+            for result in result_iter:
+                out.write(json.dumps(result) + "\n")
+                out.flush()
+                results.append(result)
+                if on_result:
+                    on_result(result)
+        finally:
+            if pool:
+                pool.terminate()
+    return results
+
+
+def load_results(path: str) -> List[dict]:
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def standings(results: List[dict]) -> Dict[str, Tuple[int, float]]:
+    """
+    :return: name -> (games, points)
+    """
+    table: Dict[str, List[float]] = dict()
+    for result in results:
+        for name, points in ((result['first'], result['result']), (result['second'], 1.0 - result['result'])):
+            games_points = table.setdefault(name, [0, 0.0])
+            games_points[0] += 1
+            games_points[1] += points
+    return {name: (int(games), points) for name, (games, points) in table.items()}
+
+
+def fit_elo(first: np.ndarray, second: np.ndarray, points: np.ndarray, num_players: int,
+            iterations: int = 1000) -> np.ndarray:
+    """
+    maximum likelihood Bradley-Terry (Elo) ratings, by minorization-maximization.
+    Every pair that met gets one virtual draw, so that a player who won (or lost)
+    all its games still gets a finite rating.
+    :param first: (G,) player indices
+    :param second: (G,) player indices
+    :param points: (G,) the points of the first player of every game
+    :return: (num_players,) ratings, with a mean of 0. nan for players without games.
+    """
+    wins = np.zeros((num_players, num_players))
+    games = np.zeros((num_players, num_players))
+    np.add.at(wins, (first, second), points)
+    np.add.at(wins, (second, first), 1.0 - points)
+    np.add.at(games, (first, second), 1.0)
+    np.add.at(games, (second, first), 1.0)
+    met = games > 0
+    wins += 0.5 * met
+    games += 1.0 * met
+    total_wins = wins.sum(axis=1)
+    played = total_wins > 0
+    strength = np.ones(num_players)
+    for _ in range(iterations):
+        denom = (games / (strength[:, None] + strength[None, :])).sum(axis=1)
+        new_strength = np.where(played, total_wins / np.where(played, denom, 1.0), 1.0)
+        # normalise (the ratings are only relative)
+        new_strength /= np.exp(np.log(new_strength[played]).mean())
+        converged = np.allclose(new_strength, strength, rtol=1e-9)
+        strength = new_strength
+        if converged:
+            break
+    ratings = 400.0 * np.log10(strength)
+    ratings[~played] = np.nan
+    return ratings - np.nanmean(ratings)
+
+
+def elo_ratings(results: List[dict], bootstrap: int = 200, confidence: float = 0.95,
+                seed: int = 0) -> Dict[str, Tuple[float, float, float]]:
+    """
+    :param bootstrap: the number of resamples of the games, for the confidence intervals.
+    :return: name -> (elo, lower bound, upper bound)
+    """
+    if not results:
+        return dict()
+    names = sorted({result['first'] for result in results} | {result['second'] for result in results})
+    index = {name: idx for idx, name in enumerate(names)}
+    first = np.array([index[result['first']] for result in results], dtype=np.intp)
+    second = np.array([index[result['second']] for result in results], dtype=np.intp)
+    points = np.array([result['result'] for result in results], dtype=float)
+    ratings = fit_elo(first, second, points, len(names))
+    rng = np.random.default_rng(seed)
+    samples = list()
+    for _ in range(bootstrap):
+        sample = rng.integers(0, len(results), len(results))
+        samples.append(fit_elo(first[sample], second[sample], points[sample], len(names)))
+    tail = 100.0 * (1.0 - confidence) / 2
+    if samples:
+        lower, upper = np.nanpercentile(np.array(samples), [tail, 100.0 - tail], axis=0)
+    else:
+        lower, upper = ratings, ratings
+    return {name: (float(ratings[idx]), float(lower[idx]), float(upper[idx])) for name, idx in index.items()}
@@ -0,0 +1,94 @@
+from typing import List, Optional, Tuple
+import random
+
+from kalah_python.utils.board import Board, PackedBoard
+from kalah_python.utils.enums import Side
+
+# a cell can never hold more than all the seeds on the board
+MAX_SEEDS: int = 2 * Board.HOLES_PER_SIDE * Board.SEEDS_PER_HOLE
+# zobrist keys: one random 64-bit key per (cell, seeds in the cell), and one for south to move.
+_rng = random.Random(34120)
+ZOBRIST_CELLS: List[List[int]] = [
+    [_rng.getrandbits(64) for _ in range(MAX_SEEDS + 1)]
+    for _ in range(PackedBoard.CELLS)
+]
+ZOBRIST_SOUTH: int = _rng.getrandbits(64)
+
+
+def zobrist_key(cells: List[int], side: Side) -> int:
+    """
+    :return: the zobrist hash of the cells, with the given side to move.
+    """
+    key = ZOBRIST_SOUTH if side == Side.SOUTH else 0
+    for idx, seeds in enumerate(cells):
+        key ^= ZOBRIST_CELLS[idx][seeds]
+    return key
+
+
+class TranspositionTable:
+    """
+    A bounded transposition table with two slots per bucket:
+    a depth-preferred slot, which keeps the deepest search of a bucket (unless it is
+    left over from an older search), and an always-replace slot, which takes everything else.
+    Entries are (key, depth, flag, value, best_move) tuples.
+    """
+    EXACT: int = 0
+    LOWER: int = 1  # the value is a lower bound (fail high)
+    UPPER: int = 2  # the value is an upper bound (fail low)
+    # rough size of one stored entry in bytes: the tuple, its int & float objects, and the slot
+    ENTRY_BYTES: int = 160
+
+    def __init__(self, size_mb: float = 16.0):
+        """
+        :param size_mb: the memory cap of the table.
+        """
+        self.buckets: int = max(1, int(size_mb * 2 ** 20) // (2 * TranspositionTable.ENTRY_BYTES))
+        self.depth_preferred: List[Optional[Tuple]] = [None] * self.buckets
+        self.always_replace: List[Optional[Tuple]] = [None] * self.buckets
+        self.generations: List[int] = [0] * self.buckets  # the search the depth-preferred entry came from
+        self.generation: int = 0
+        self.hits: int = 0
+        self.probes: int = 0
+
+    def new_search(self):
+        """
+        to be called before every search, so that stale deep entries can be replaced.
+        """
+        self.generation += 1
+
+    def probe(self, key: int) -> Optional[Tuple]:
+        self.probes += 1
+        idx = key % self.buckets
+        entry = self.depth_preferred[idx]
+        if entry is not None and entry[0] == key:
+            self.hits += 1
+            return entry
+        entry = self.always_replace[idx]
+        if entry is not None and entry[0] == key:
+            self.hits += 1
+            return entry
+        return None
+
+    def store(self, key: int, depth: int, flag: int, value: float, best_move: int):
+        idx = key % self.buckets
+        entry = (key, depth, flag, value, best_move)
+        current = self.depth_preferred[idx]
+        if current is None \
+                or current[0] == key \
+                or depth >= current[1] \
+                or self.generations[idx] != self.generation:
+            self.depth_preferred[idx] = entry
+            self.generations[idx] = self.generation
+        else:
+            self.always_replace[idx] = entry
+
+    def clear(self):
+        self.depth_preferred = [None] * self.buckets
+        self.always_replace = [None] * self.buckets
+        self.generations = [0] * self.buckets
+        self.hits = 0
+        self.probes = 0
+
+    def __len__(self) -> int:
+        return sum(entry is not None for entry in self.depth_preferred) \
+               + sum(entry is not None for entry in self.always_replace)